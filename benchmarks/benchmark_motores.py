@@ -0,0 +1,157 @@
+"""
+Benchmark de motores de BD (SQLite vs DuckDB) sobre las vistas de reporting.
+
+Implementación:
+- Genera tablas de hechos y dimensiones sintéticas con el esquema de los marts
+- Crea las vistas de reporting a partir de los modelos dbt reales (ref() → nombre de tabla)
+- Mide la carga de las tablas y la lectura completa de cada vista (mediana de N repeticiones)
+
+Uso:
+    python benchmarks/benchmark_motores.py --filas 1000000 --repeticiones 3
+"""
+
+import re
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.motor_bd import obtener_motor # pylint: disable=wrong-import-position
+
+
+
+
+DIR_REPORTING = Path(__file__).parent.parent / "dbt_env" / "models" / "marts" / "reporting"
+VISTAS = [
+    "vw_gastos_mensuales",
+    "vw_ingresos_mensuales",
+    "vw_mrr_mensual",
+    "vw_nuevos_clientes_trimestrales",
+    "vw_fcf_mensual",
+    "vw_cac_canal",
+]
+PAISES = ["COLOMBIA", "MEXICO", "PERU", "CHILE", "ARGENTINA"]
+CATEGORIAS = ["MARKETING", "NOMINA", "CLOUD", "OFICINA", "VIAJES", "LEGAL"]
+PLANES = ["BASIC", "PRO", "ENTERPRISE"]
+CANALES = ["ORGANIC", "PAID", "REFERRAL", "PARTNER"]
+
+
+
+
+def generar_datos(filas: int, semilla: int = 0) -> dict[str, pd.DataFrame]:
+    """Tablas sintéticas con las columnas que usan las vistas de reporting"""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range("2024-01-01", "2024-12-31", freq="D")
+    date_keys = fechas.strftime("%Y%m%d").astype(int).to_numpy()
+    n_clientes = max(filas // 10, 1)
+
+    dim_fecha = pd.DataFrame({
+        "date_key": date_keys,
+        "year": fechas.year,
+        "quarter": "Q" + fechas.quarter.astype(str),
+        "month": fechas.month,
+        "day": fechas.day,
+    })
+    dim_clientes = pd.DataFrame({
+        "customer_key": np.arange(n_clientes).astype(str),
+        "country": rng.choice(PAISES, n_clientes),
+        "acquisition_channel": rng.choice(CANALES, n_clientes),
+        "registration_date_key": rng.choice(date_keys, n_clientes),
+    })
+    fact_gastos = pd.DataFrame({
+        "expense_key": np.arange(filas).astype(str),
+        "date_key": rng.choice(date_keys, filas),
+        "category": rng.choice(CATEGORIAS, filas),
+        "amount_usd": rng.lognormal(5, 0.5, filas).round(2),
+        "country": rng.choice(PAISES, filas),
+    })
+    fact_transacciones = pd.DataFrame({
+        "transaction_key": np.arange(filas).astype(str),
+        "customer_key": rng.integers(0, n_clientes, filas).astype(str),
+        "date_key": rng.choice(date_keys, filas),
+        "country": rng.choice(PAISES, filas),
+        "total_usd": rng.lognormal(6, 0.4, filas).round(2),
+    })
+    inicio = rng.choice(date_keys[:300], n_clientes)
+    fact_suscripciones = pd.DataFrame({
+        "subscription_key": np.arange(n_clientes).astype(str),
+        "customer_key": np.arange(n_clientes).astype(str),
+        "plan": rng.choice(PLANES, n_clientes),
+        "start_date_key": inicio,
+        "end_date_key": np.where(rng.random(n_clientes) < 0.5, None, inicio + 100),
+        "status": rng.choice(["ACTIVE", "CANCELLED"], n_clientes, p=[0.8, 0.2]),
+        "monthly_price_usd": rng.choice([29.0, 99.0, 499.0], n_clientes),
+    })
+    return {
+        "dim_fecha": dim_fecha,
+        "dim_clientes": dim_clientes,
+        "fact_gastos": fact_gastos,
+        "fact_transacciones": fact_transacciones,
+        "fact_suscripciones": fact_suscripciones,
+    }
+
+
+def sql_vista(nombre: str) -> str:
+    """SQL de una vista de reporting con las referencias dbt resueltas a nombres de tabla"""
+    sql = (DIR_REPORTING / f"{nombre}.sql").read_text(encoding="utf-8")
+    sql = re.sub(r"\{\{\s*config\(.*?\)\s*\}\}", "", sql)
+    return re.sub(r"\{\{\s*ref\('(\w+)'\)\s*\}\}", r"\1", sql)
+
+
+def medir_motor(
+    nombre_motor: str, datos: dict[str, pd.DataFrame], repeticiones: int, directorio: Path
+) -> dict[str, float]:
+    """Tiempos (s) de carga y de lectura de cada vista para un motor"""
+    motor = obtener_motor(nombre_motor)
+    con = motor.conectar(directorio / "benchmark")
+    tiempos: dict[str, float] = {}
+    try:
+        inicio = time.perf_counter()
+        for tabla, df in datos.items():
+            motor.escribir_tabla(con, tabla, df)
+        tiempos["carga"] = time.perf_counter() - inicio
+
+        for vista in VISTAS:
+            con.execute(f"CREATE VIEW {vista} AS {sql_vista(vista)}")
+        for vista in VISTAS:
+            muestras = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                motor.leer(con, f"SELECT * FROM {vista}")
+                muestras.append(time.perf_counter() - inicio)
+            tiempos[vista] = float(np.median(muestras))
+    finally:
+        con.close()
+    return tiempos
+
+
+def main():
+    """Ejecuta el benchmark e imprime la comparación"""
+    parser = argparse.ArgumentParser(description="Benchmark SQLite vs DuckDB")
+    parser.add_argument("--filas", type=int, default=1_000_000, help="Filas por tabla de hechos")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Repeticiones por vista")
+    args = parser.parse_args()
+
+    datos = generar_datos(args.filas)
+    with tempfile.TemporaryDirectory() as tmp:
+        resultados = {
+            motor: medir_motor(motor, datos, args.repeticiones, Path(tmp))
+            for motor in ("sqlite", "duckdb")
+        }
+
+    print(f"\nFilas por tabla de hechos: {args.filas:,}")
+    print(f"{'Etapa':<34}{'SQLite (s)':>12}{'DuckDB (s)':>12}{'Speedup':>10}")
+    print("─" * 68)
+    for etapa in ["carga"] + VISTAS:
+        sqlite_s, duckdb_s = resultados["sqlite"][etapa], resultados["duckdb"][etapa]
+        print(f"{etapa:<34}{sqlite_s:>12.3f}{duckdb_s:>12.3f}{sqlite_s / duckdb_s:>9.1f}x")
+
+
+
+
+if __name__ == "__main__":
+    main()
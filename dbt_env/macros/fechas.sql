@@ -0,0 +1,57 @@
+{#- Funciones de fecha portables entre SQLite (dbt-sqlite) y DuckDB (dbt-duckdb) -#}
+
+{% macro formatear_fecha(formato, columna) %}
+    {{ return(adapter.dispatch('formatear_fecha')(formato, columna)) }}
+{% endmacro %}
+
+{% macro default__formatear_fecha(formato, columna) -%}
+    strftime('{{ formato }}', {{ columna }})
+{%- endmacro %}
+
+{% macro duckdb__formatear_fecha(formato, columna) -%}
+    strftime(CAST({{ columna }} AS DATE), '{{ formato }}')
+{%- endmacro %}
+
+
+{% macro date_key(columna) -%}
+    CAST({{ formatear_fecha('%Y%m%d', columna) }} AS INTEGER)
+{%- endmacro %}
+
+
+{% macro fecha_literal(valor) %}
+    {{ return(adapter.dispatch('fecha_literal')(valor)) }}
+{% endmacro %}
+
+{% macro default__fecha_literal(valor) -%}
+    date('{{ valor }}')
+{%- endmacro %}
+
+{% macro duckdb__fecha_literal(valor) -%}
+    DATE '{{ valor }}'
+{%- endmacro %}
+
+
+{% macro sumar_dias(columna, dias) %}
+    {{ return(adapter.dispatch('sumar_dias')(columna, dias)) }}
+{% endmacro %}
+
+{% macro default__sumar_dias(columna, dias) -%}
+    date({{ columna }}, '+{{ dias }} day')
+{%- endmacro %}
+
+{% macro duckdb__sumar_dias(columna, dias) -%}
+    CAST({{ columna }} + INTERVAL {{ dias }} DAY AS DATE)
+{%- endmacro %}
+
+
+{% macro trimestre(columna) %}
+    {{ return(adapter.dispatch('trimestre')(columna)) }}
+{% endmacro %}
+
+{% macro default__trimestre(columna) -%}
+    'Q' || ((CAST(strftime('%m', {{ columna }}) AS INT) - 1) / 3 + 1)
+{%- endmacro %}
+
+{% macro duckdb__trimestre(columna) -%}
+    'Q' || CAST(quarter(CAST({{ columna }} AS DATE)) AS VARCHAR)
+{%- endmacro %}
@@ -3,5 +3,5 @@ SELECT DISTINCT
     country,
     acquisition_channel,
     segment,
-    CAST(strftime('%Y%m%d', registration_date) AS INTEGER) AS registration_date_key
+    {{ date_key('registration_date') }} AS registration_date_key
 FROM {{ ref('stg_clientes') }}
\ No newline at end of file
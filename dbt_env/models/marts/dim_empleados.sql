@@ -3,5 +3,5 @@ SELECT DISTINCT
     area,
     salary_usd,
     country,
-    CAST(strftime('%Y%m%d', hire_date) AS INTEGER) AS hire_date_key
+    {{ date_key('hire_date') }} AS hire_date_key
 FROM {{ ref('stg_empleados') }}
\ No newline at end of file
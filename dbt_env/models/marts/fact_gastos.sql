@@ -1,6 +1,6 @@
 SELECT
     expense_id AS expense_key,
-    CAST(strftime('%Y%m%d', date) AS INTEGER) AS date_key,
+    {{ date_key('date') }} AS date_key,
     provider,
     category,
     amount_usd,
@@ -1,7 +1,7 @@
 SELECT
     payment_id AS payment_key,
     transaction_id AS transaction_key,
-    CAST(strftime('%Y%m%d', payment_date) AS INTEGER) AS payment_date_key,
+    {{ date_key('payment_date') }} AS payment_date_key,
     method AS payment_method,
     amount_usd
 FROM {{ ref('stg_pagos') }}
\ No newline at end of file
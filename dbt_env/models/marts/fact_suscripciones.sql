@@ -1,8 +1,8 @@
 SELECT
     subscription_id AS subscription_key,
     customer_id AS customer_key,
-    CAST(strftime('%Y%m%d', start_date) AS INTEGER) AS start_date_key,
-    CAST(strftime('%Y%m%d', end_date) AS INTEGER) AS end_date_key,
+    {{ date_key('start_date') }} AS start_date_key,
+    {{ date_key('end_date') }} AS end_date_key,
     plan,
     status,
     monthly_price_usd
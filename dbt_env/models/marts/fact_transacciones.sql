@@ -1,7 +1,7 @@
 SELECT
     transaction_id AS transaction_key,
     customer_id AS customer_key,
-    CAST(strftime('%Y%m%d', date) AS INTEGER) AS date_key,
+    {{ date_key('date') }} AS date_key,
     country,
     quantity,
     unit_price_usd,
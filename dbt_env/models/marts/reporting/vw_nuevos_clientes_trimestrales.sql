@@ -8,4 +8,4 @@ SELECT
     COUNT(dc.customer_key) AS nuevos_clientes
 FROM {{ ref('dim_clientes') }} dc
 INNER JOIN {{ ref('dim_fecha') }} df ON dc.registration_date_key = df.date_key
-GROUP BY df.year, df.month, dc.country, dc.acquisition_channel
\ No newline at end of file
+GROUP BY df.year, df.quarter, dc.country, dc.acquisition_channel
\ No newline at end of file
@@ -3,15 +3,24 @@
 - Ejecuta el pipeline completo: Extracción → dbt → Análisis IA
 """
 
+import os
 import sys
+import hashlib
 from pathlib import Path
 import argparse
 import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from src.pipeline_extraccion import ejecutar_pipeline
-from src.analisis_financiero import ejecutar_analisis_ia
+from src.pipeline_extraccion import ejecutar_pipeline, PARTICIONADO
+from src.particiones import (
+    particiones_pendientes,
+    registrar_construccion,
+    seleccionar_particiones,
+)
+from src.analisis_financiero import ejecutar_analisis_ia, reconstruir_estado_forecast
+from src.vigilancia_raw import VigilanteRaw
 
 
 
@@ -41,6 +50,64 @@ def ejecutar_extraccion(): # pragma: no cover
     ejecutar_pipeline()
 
 
+def huella_proyecto_dbt(directorio: Path = Path("dbt_env")) -> str:
+    """Huella de los modelos, macros y configuración del proyecto dbt (cambia si cambia su SQL/YAML)"""
+    archivos = sorted(
+        ruta for patron in ("*.sql", "*.yml")
+        for ruta in directorio.rglob(patron)
+        if not {"target", "logs", "dbt_packages"} & set(ruta.relative_to(directorio).parts)
+    )
+    h = hashlib.sha256()
+    for ruta in archivos:
+        h.update(str(ruta.relative_to(directorio)).encode("utf-8"))
+        h.update(ruta.read_bytes())
+    return h.hexdigest()
+
+
+def ejecutar_dbt_por_particion() -> bool:
+    """
+    - Ejecuta 'dbt build' en paralelo solo sobre los shards por país cuyo contenido o proyecto dbt
+      cambió desde su última construcción exitosa (registrada en el catálogo)
+    - Cada ejecución apunta a su shard con DBT_SQLITE_DB y usa su propio target/log path
+    - El shard SIN_VALOR (filas sin país atribuible) se conserva pero no se transforma
+    """
+    if seleccionar_particiones("pais").empty:
+        logger.error("No hay particiones por país registradas en el catálogo.")
+        return False
+    version = huella_proyecto_dbt()
+    rutas = particiones_pendientes("pais", version)
+    if rutas.empty:
+        logger.info("Todas las particiones por país están construidas y al día.")
+        return True
+    logger.info("Particiones por país a construir: %s", ", ".join(rutas["valor"]))
+
+    def construir(valor: str, ruta: str) -> bool:
+        comando = [
+            "dbt", "build",
+            "--target-path", f"target/pais/{valor}",
+            "--log-path", f"logs/pais/{valor}",
+        ]
+        logger.info("Ejecutando sobre '%s': %s", valor, ' '.join(comando))
+        result = subprocess.run(
+            comando,
+            cwd="dbt_env",
+            env={**os.environ, "DBT_SQLITE_DB": str(Path(ruta).resolve())},
+            capture_output=False,
+            check=False,
+        )
+        if result.returncode != 0:
+            logger.error("Falló dbt build para la partición '%s'", valor)
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        resultados = list(pool.map(construir, rutas["valor"], rutas["ruta"]))
+    registrar_construccion(
+        "pais", [valor for valor, ok in zip(rutas["valor"], resultados) if ok], version
+    )
+    return all(resultados)
+
+
 def ejecutar_transformacion():
     """Ejecución de la etapa de extracción con dbt"""
     def ejecutar_comando_dbt(comando):
@@ -73,11 +140,16 @@ def ejecutar_transformacion():
         ["dbt", "deps"],
         ["dbt", "build"],
     ]
+    if PARTICIONADO == "pais":
+        comandos = comandos[:-1]
     for comando in comandos:
         ok = ejecutar_comando_dbt(comando)
         if not ok:
             logger.error("Se detuvo el flujo de dbt por error previo.")
             return
+    if PARTICIONADO == "pais" and not ejecutar_dbt_por_particion():
+        logger.error("Se detuvo el flujo de dbt por error en una partición.")
+        return
     logger.info("Ejecución completa de dbt finalizada exitosamente.")
 
 
@@ -89,24 +161,54 @@ def ejecutar_analisis_financiero(): # pragma: no cover
     ejecutar_analisis_ia()
 
 
+def ejecutar_reconstruccion_estado(): # pragma: no cover
+    """Reconstrucción y verificación del estado incremental de forecast"""
+    logger.info("=" * 60)
+    logger.info("RECONSTRUCCIÓN DEL ESTADO DE FORECAST")
+    logger.info("=" * 60)
+    inconsistentes = reconstruir_estado_forecast()
+    if inconsistentes:
+        raise RuntimeError(
+            f"El estado incremental no coincidía para: {', '.join(inconsistentes)}"
+        )
+
+
+def ejecutar_modo_watch(): # pragma: no cover
+    """Procesamiento continuo en micro-lotes de los archivos nuevos en data/raw"""
+    logger.info("=" * 60)
+    logger.info("MODO WATCH: MICRO-LOTES DESDE DATA/RAW")
+    logger.info("=" * 60)
+    VigilanteRaw().ejecutar()
+
+
 def main():
     """Generar argumentos y ejecutar el pipeline completo"""
     parser = argparse.ArgumentParser(description="Financial Data Pipeline")
     parser.add_argument(
         "--step",
-        choices=["extract", "transform", "ia-analysis", "all"],
+        choices=["extract", "transform", "ia-analysis", "rebuild-forecast-state", "all"],
         default="all",
         help="Execution step (default: all)",
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Watch data/raw and process new or changed files in micro-batches",
+    )
     args = parser.parse_args()
 
     try:
+        if args.watch:
+            ejecutar_modo_watch()
+            return
         if args.step in ("extract", "all"):
             ejecutar_extraccion()
         if args.step in ("transform", "all"):
             ejecutar_transformacion()
         if args.step in ("ia-analysis", "all"):
             ejecutar_analisis_financiero()
+        if args.step == "rebuild-forecast-state":
+            ejecutar_reconstruccion_estado()
     except Exception as e: # pylint: disable=broad-exception-caught
         logger.critical("El pipeline falló inesperadamente: %s", e, exc_info=False)
         sys.exit(1)
@@ -9,14 +9,47 @@ Implementación:
 
 import os
 import logging
+import itertools
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 from datetime import datetime
-import sqlite3
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
 import anthropic
 
+from src.deteccion_anomalias import (
+    FUENTES,
+    columnas_fuente,
+    detectar_anomalias,
+    detectar_anomalias_tablas,
+    guardar_anomalias,
+)
+from src.forecast_masivo import forecast_por_segmento
+from src.motor_bd import obtener_motor
+from src.particiones import VISTAS_POR_PAIS, leer_particionado
+from src.reporte import (
+    TITULO_REPORTE,
+    guardar_formatos,
+    renderizar,
+    seccion_anomalias,
+    seccion_categorias,
+    seccion_forecast,
+    seccion_planes,
+    seccion_tendencias,
+)
+from src.estado_forecast import (
+    cargar_estados,
+    construir_estado,
+    diferencias_estado,
+    estado_vigente,
+    forecast_desde_estado,
+    guardar_estados,
+    huella_historia,
+    sincronizar_estado,
+    tendencia_desde_estado,
+)
+from src.pipeline_extraccion import leer_huellas_carga
 
 
 
@@ -25,15 +58,61 @@ logger = logging.getLogger("analisis_financiero")
 
 DB_PATH = Path("data/innova_finance.db")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
+PARTICIONADO = os.getenv("PARTICIONADO", "")
+PAISES_ANALISIS = [p.strip().upper() for p in os.getenv("PAISES_ANALISIS", "").split(",") if p.strip()]
+IA_MODELO = "claude-haiku-4-5-20251001"
+IA_MAX_TOKENS = 1024
+IA_STREAMING = os.getenv("IA_STREAMING", "0") == "1"
+IA_TIMEOUT_CHUNK_S = float(os.getenv("IA_TIMEOUT_CHUNK_S", "30"))
+
+MENSAJE_IA_DESACTIVADA = (
+    "[IA desactivada] Configura ANTHROPIC_API_KEY en tu archivo .env "
+    "para habilitar el análisis con IA."
+)
+SEPARADOR_CONCLUSIONES = "\n\n==== CONCLUSIONES IA ====\n"
+
+RESUMEN_MAX_TOKENS = int(os.getenv("RESUMEN_MAX_TOKENS", "3000"))
+RESUMEN_TOP_N = int(os.getenv("RESUMEN_TOP_N", "15"))
+CHARS_POR_TOKEN = 3
+FORECAST_SEGMENTOS = os.getenv("FORECAST_SEGMENTOS", "0") == "1"
+TABLA_FORECAST_SEGMENTOS = "forecast_segmentos"
+TABLA_MARGEN_PAIS = "margen_proyectado_pais"
+# Series principales: vista, columna de monto y tablas raw de las que depende (huellas de carga)
+SERIES_PRINCIPALES = {
+    "gastos":   ("vw_gastos_mensuales",   "gastos_usd",   ["raw_gastos"]),
+    "ingresos": ("vw_ingresos_mensuales", "ingresos_usd", ["raw_transacciones"]),
+    "mrr":      ("vw_mrr_mensual",        "mrr_usd",      ["raw_suscripciones", "raw_clientes"]),
+}
+ORDEN_SECCIONES = ("categorias", "planes", "tendencias", "forecast", "anomalias")
+PRIORIDAD_SECCIONES = ("forecast", "tendencias", "anomalias", "categorias", "planes")
+
+
+
+
+def _leer_vista(nombre_vista: str, desde: pd.Timestamp | None = None) -> pd.DataFrame:
+    """
+    - Lee cualquier vista desde la BD; con 'desde' solo los meses posteriores (vistas con anio y mes)
+    - Con almacenamiento particionado por país, las vistas agrupadas por país se leen solo
+      desde los shards de PAISES_ANALISIS (o de todos si no se indica)
+    """
+    filtro, params = "", ()
+    if desde is not None:
+        filtro, params = "anio * 100 + mes > ?", (desde.year * 100 + desde.month,)
+
+    if PARTICIONADO == "pais" and nombre_vista in VISTAS_POR_PAIS:
+        try:
+            return leer_particionado(
+                nombre_vista, PAISES_ANALISIS or None, clave="pais", filtro=filtro, params=params
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("Error leyendo %s desde particiones: %s", nombre_vista, e)
+            raise RuntimeError(f"Error leyendo {nombre_vista}: {e}") from e
 
-
-
-
-def _leer_vista(nombre_vista: str) -> pd.DataFrame:
-    """Lee cualquier vista desde la BD"""
-    con = sqlite3.connect(DB_PATH)
+    motor = obtener_motor()
+    con = motor.conectar(DB_PATH)
     try:
-        df = pd.read_sql(f"SELECT * FROM {nombre_vista}", con)
+        where = f" WHERE {filtro}" if filtro else ""
+        df = motor.leer(con, f"SELECT * FROM {nombre_vista}{where}", params)
     except Exception as e:  # pylint: disable=broad-exception-caught
         logger.error("Error leyendo %s: %s", nombre_vista, e)
         raise RuntimeError(f"Error leyendo {nombre_vista}: {e}") from e
@@ -54,6 +133,34 @@ def _obtener_mrr() -> pd.DataFrame:
     return _leer_vista("vw_mrr_mensual")
 
 
+def _obtener_anomalias() -> pd.DataFrame:
+    """
+    - Ejecuta la detección de anomalías sobre los hechos y retorna las marcadas
+    - Con particiones por país los hechos se leen desde los shards de PAISES_ANALISIS
+    """
+    motor = obtener_motor()
+    if PARTICIONADO == "pais":
+        tablas = {
+            origen: leer_particionado(fuente["tabla"], PAISES_ANALISIS or None, clave="pais")
+            for origen, fuente in FUENTES.items()
+        }
+        anomalias = detectar_anomalias_tablas({
+            origen: df.reindex(columns=columnas_fuente(origen)) for origen, df in tablas.items()
+        })
+        con = motor.conectar(DB_PATH)
+        try:
+            guardar_anomalias(con, anomalias, motor)
+        finally:
+            con.close()
+        return anomalias
+
+    con = motor.conectar(DB_PATH)
+    try:
+        return detectar_anomalias(con, motor=motor)
+    finally:
+        con.close()
+
+
 def resumen_por_categoria(df: pd.DataFrame) -> pd.DataFrame:
     """Agrupa gasto total y % por categoría"""
     resumen = (
@@ -83,6 +190,8 @@ def resumen_mrr_por_plan(df: pd.DataFrame) -> pd.DataFrame:
 
 def _serie_mensual(df: pd.DataFrame, col_monto: str) -> pd.Series:
     """Convierte un DataFrame en una serie mensual de totales"""
+    if df.empty:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], name="periodo"), name=col_monto)
     df = df.copy()
     df["periodo"] = pd.to_datetime(
         df["anio"].astype(str) + "-" + df["mes"].astype(str).str.zfill(2)
@@ -123,24 +232,38 @@ def forecast_lineal(serie: pd.Series, meses_adelante: int = 3) -> pd.DataFrame:
     return resultado
 
 
+def _agregar_forecast(df: pd.DataFrame, claves: list[str], columna: str) -> pd.DataFrame:
+    """Suma un forecast al nivel (periodo, claves...) y renombra su columna de monto"""
+    return (
+        df.groupby(["periodo"] + claves, as_index=False)["forecast_usd"]
+        .sum()
+        .rename(columns={"forecast_usd": columna})
+    )
+
+
 def calcular_margen_proyectado(
     forecast_ingresos: pd.DataFrame,
     forecast_gastos: pd.DataFrame,
     forecast_mrr: pd.DataFrame,
+    claves: list[str] | None = None,
 ) -> pd.DataFrame:
     """
     - Une los tres forecasts en una tabla de margen proyectado
     - El margen se calcula sobre ingresos totales
+    - Con 'claves' (p. ej. ['pais']) el margen se calcula por segmento; los forecasts más
+      granulares (p. ej. país × categoría de 'forecast_por_segmento') se suman a ese nivel
     """
-    df = forecast_ingresos.copy().rename(columns={"forecast_usd": "ingresos_forecast"})
+    claves = claves or []
+    llaves = ["periodo"] + claves
+    df = _agregar_forecast(forecast_ingresos, claves, "ingresos_forecast")
     df = df.merge(
-        forecast_gastos.rename(columns={"forecast_usd": "gastos_forecast"}),
-        on="periodo",
+        _agregar_forecast(forecast_gastos, claves, "gastos_forecast"),
+        on=llaves,
         how="left",
     )
     df = df.merge(
-        forecast_mrr.rename(columns={"forecast_usd": "mrr_forecast"}),
-        on="periodo",
+        _agregar_forecast(forecast_mrr, claves, "mrr_forecast"),
+        on=llaves,
         how="left",
     )
     df["margen_usd"] = (df["ingresos_forecast"] - df["gastos_forecast"]).round(2)
@@ -169,7 +292,22 @@ def calcular_tendencia(serie: pd.Series) -> dict:
     }
 
 
-def construir_resumen(
+def estimar_tokens(texto: str) -> int:
+    """Estimación conservadora de tokens (sin tokenizador): ~CHARS_POR_TOKEN caracteres por token"""
+    return -(-len(texto) // CHARS_POR_TOKEN)
+
+
+def _niveles_top_n(top_n: int, total: int) -> list[int]:
+    """Niveles de compactación decrecientes: top_n, top_n/2, ..., 1"""
+    niveles = []
+    n = min(top_n, total)
+    while n >= 1:
+        niveles.append(n)
+        n //= 2
+    return niveles
+
+
+def construir_reporte(
     df_gastos: pd.DataFrame,
     df_ingresos: pd.DataFrame,
     df_mrr: pd.DataFrame,
@@ -179,97 +317,184 @@ def construir_resumen(
     tendencia_ingresos: dict,
     tendencia_mrr: dict,
     margen_proyectado: pd.DataFrame,
-) -> str:
-    """Construye el texto de contexto que se enviará a Claude"""
-    lineas = [
-        "═══ ANÁLISIS FINANCIERO – INNOVA FINANCE ═══",
-        f"Fecha del análisis: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-        f"Registros de gasto   : {len(df_gastos)}",
-        f"Registros de ingresos: {len(df_ingresos)}",
-        f"Registros de MRR     : {len(df_mrr)}",
-        "",
-        "── CLASIFICACIÓN DE GASTOS POR CATEGORÍA ──",
-    ]
+    anomalias: pd.DataFrame | None = None,
+    max_tokens: int | None = None,
+    top_n: int | None = None,
+    prioridad: tuple[str, ...] = PRIORIDAD_SECCIONES,
+) -> dict:
+    """
+    - Construye el texto de contexto que se enviará a Claude, dentro de un presupuesto de tokens
+    - Las secciones se incluyen por prioridad (por defecto forecast > tendencias > anomalías >
+      categorías > planes);
+      si una no cabe se compacta (top-N + 'OTROS', tendencias en una línea) y, si aún no cabe, se omite
+      con una advertencia; las secciones sin filas se descartan antes, sin advertencia
+    - El orden de salida de las secciones no cambia, solo cuáles se incluyen y con qué detalle
+    - Retorna {'texto', 'metadatos', 'secciones'}; 'secciones' son las incluidas en el texto
+      (los formatos estructurados usan las tablas completas de 'secciones_reporte')
+    """
+    presupuesto = RESUMEN_MAX_TOKENS if max_tokens is None else max_tokens
+    top_n = RESUMEN_TOP_N if top_n is None else top_n
+    tendencias = {
+        "GASTOS": tendencia_gastos,
+        "INGRESOS": tendencia_ingresos,
+        "MRR": tendencia_mrr,
+    }
 
-    for _, row in resumen_cat.iterrows():
-        lineas.append(
-            f"  • {row['category']:<22} "
-            f"USD {row['total']:>12,.2f}  ({row['pct']}%)  "
-            f"[{int(row['transacciones'])} transacciones]"
-        )
+    metadatos = {
+        "fecha": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "registros_gastos": len(df_gastos),
+        "registros_ingresos": len(df_ingresos),
+        "registros_mrr": len(df_mrr),
+    }
+    encabezado = [
+        f"═══ {TITULO_REPORTE} ═══",
+        f"Fecha del análisis: {metadatos['fecha']}",
+        f"Registros de gasto   : {metadatos['registros_gastos']}",
+        f"Registros de ingresos: {metadatos['registros_ingresos']}",
+        f"Registros de MRR     : {metadatos['registros_mrr']}",
+    ]
 
-    lineas += ["", "── MRR ACTIVO POR PLAN ──"]
-    for _, row in resumen_mrr.iterrows():
-        lineas.append(
-            f"  • {row['plan']:<22} "
-            f"USD {row['mrr_total']:>12,.2f}  ({row['pct']}%)  "
-            f"[{int(row['suscripciones'])} suscripciones]"
-        )
+    # Candidatos de cada sección, del más detallado al más compacto (se generan bajo demanda)
+    candidatos = {
+        "categorias": (
+            seccion_categorias(resumen_cat, n)
+            for n in _niveles_top_n(top_n, len(resumen_cat))
+        ),
+        "planes": (
+            seccion_planes(resumen_mrr, n)
+            for n in _niveles_top_n(top_n, len(resumen_mrr))
+        ),
+        "tendencias": (
+            seccion_tendencias(tendencias, compacto=compacto) for compacto in (False, True)
+        ),
+        "forecast": (seccion_forecast(margen_proyectado),),
+        "anomalias": (
+            seccion_anomalias(anomalias, n)
+            for n in _niveles_top_n(top_n, 0 if anomalias is None else len(anomalias))
+        ),
+    }
 
-    def _bloque_tendencia(label: str, t: dict) -> list[str]:
-        if not t:
-            return []
-        return [
-            "",
-            f"── TENDENCIA HISTÓRICA – {label} ──",
-            f"  Períodos analizados      : {t.get('n_periodos')} meses",
-            f"  Media mensual            : USD {t.get('media_mensual'):,.2f}",
-            f"  Máximo mensual           : USD {t.get('max_mensual'):,.2f}",
-            f"  Mínimo mensual           : USD {t.get('min_mensual'):,.2f}",
-            f"  Cambio total (inicio→fin): {t.get('cambio_total_pct')}%",
-            f"  Volatilidad mensual      : {t.get('volatilidad_pct')}%",
-        ]
-
-    lineas += _bloque_tendencia("GASTOS", tendencia_gastos)
-    lineas += _bloque_tendencia("INGRESOS", tendencia_ingresos)
-    lineas += _bloque_tendencia("MRR", tendencia_mrr)
-
-    if not margen_proyectado.empty:
-        lineas += ["", "── FORECAST PRÓXIMOS 3 MESES ──"]
-        lineas.append(
-            f"  {'Período':<10}  {'Ingresos':>14}  {'MRR':>14}  "
-            f"{'Gastos':>14}  {'Margen USD':>14}  {'Margen %':>9}"
-        )
-        lineas.append("  " + "─" * 80)
-        for _, row in margen_proyectado.iterrows():
-            lineas.append(
-                f"  {row['periodo'].strftime('%Y-%m'):<10}  "
-                f"USD {row['ingresos_forecast']:>10,.2f}  "
-                f"USD {row['mrr_forecast']:>10,.2f}  "
-                f"USD {row['gastos_forecast']:>10,.2f}  "
-                f"USD {row['margen_usd']:>10,.2f}  "
-                f"{row['margen_pct']:>8.1f}%"
+    usados = estimar_tokens("\n".join(encabezado))
+    elegidos: dict[str, dict] = {}
+    orden = list(prioridad) + [s for s in ORDEN_SECCIONES if s not in prioridad]
+    for nombre in orden:
+        opciones = iter(candidatos.get(nombre, ()))
+        primera = next(opciones, None)
+        if primera is None or primera["tabla"].empty:
+            # Sin filas (p. ej. ninguna anomalía) no hay nada que incluir ni que advertir
+            logger.debug("Sección '%s' sin datos: no se incluye", nombre)
+            continue
+        for seccion in itertools.chain((primera,), opciones):
+            costo = estimar_tokens("\n" + "\n".join(seccion["lineas"]))
+            if usados + costo <= presupuesto:
+                elegidos[nombre] = seccion
+                usados += costo
+                logger.debug("Sección '%s': ~%d tokens", nombre, costo)
+                break
+        else:
+            logger.warning(
+                "Sección '%s' omitida del resumen: excede el presupuesto de %d tokens",
+                nombre, presupuesto,
             )
 
-    return "\n".join(lineas)
+    secciones = [elegidos[nombre] for nombre in ORDEN_SECCIONES if nombre in elegidos]
+    texto = "\n".join(encabezado + [linea for s in secciones for linea in s["lineas"]])
 
+    if estimar_tokens(texto) > presupuesto:
+        texto = texto[:presupuesto * CHARS_POR_TOKEN]
+    logger.info(
+        "Resumen para IA: ~%d tokens estimados (presupuesto: %d)",
+        estimar_tokens(texto), presupuesto,
+    )
+    return {"texto": texto, "metadatos": metadatos, "secciones": secciones}
+
+
+def secciones_reporte(
+    resumen_cat: pd.DataFrame,
+    resumen_mrr: pd.DataFrame,
+    tendencia_gastos: dict,
+    tendencia_ingresos: dict,
+    tendencia_mrr: dict,
+    margen_proyectado: pd.DataFrame,
+    anomalias: pd.DataFrame | None = None,
+) -> list[dict]:
+    """
+    - Secciones con las tablas completas para Markdown, JSON y CSV (sin top-N ni presupuesto
+      de tokens, que solo aplican al texto enviado a la IA)
+    - Se omiten las secciones sin filas
+    """
+    tendencias = {
+        "GASTOS": tendencia_gastos,
+        "INGRESOS": tendencia_ingresos,
+        "MRR": tendencia_mrr,
+    }
+    secciones = {
+        "categorias": seccion_categorias(resumen_cat, len(resumen_cat)),
+        "planes": seccion_planes(resumen_mrr, len(resumen_mrr)),
+        "tendencias": seccion_tendencias(tendencias),
+        "forecast": seccion_forecast(margen_proyectado),
+    }
+    if anomalias is not None:
+        secciones["anomalias"] = seccion_anomalias(anomalias, len(anomalias))
+    return [
+        secciones[nombre] for nombre in ORDEN_SECCIONES
+        if nombre in secciones and not secciones[nombre]["tabla"].empty
+    ]
+
+
+def construir_resumen(
+    df_gastos: pd.DataFrame,
+    df_ingresos: pd.DataFrame,
+    df_mrr: pd.DataFrame,
+    resumen_cat: pd.DataFrame,
+    resumen_mrr: pd.DataFrame,
+    tendencia_gastos: dict,
+    tendencia_ingresos: dict,
+    tendencia_mrr: dict,
+    margen_proyectado: pd.DataFrame,
+    anomalias: pd.DataFrame | None = None,
+    max_tokens: int | None = None,
+    top_n: int | None = None,
+    prioridad: tuple[str, ...] = PRIORIDAD_SECCIONES,
+) -> str:
+    """Texto del resumen para la IA dentro del presupuesto de tokens (ver 'construir_reporte')"""
+    return construir_reporte(
+        df_gastos, df_ingresos, df_mrr,
+        resumen_cat, resumen_mrr,
+        tendencia_gastos, tendencia_ingresos, tendencia_mrr,
+        margen_proyectado,
+        anomalias,
+        max_tokens=max_tokens, top_n=top_n, prioridad=prioridad,
+    )["texto"]
 
-def analizar_con_ia(resumen: str) -> str:
-    """Envía el resumen financiero a Claude y retorna conclusiones clave"""
-    if not ANTHROPIC_API_KEY:
-        return (
-            "[IA desactivada] Configura ANTHROPIC_API_KEY en tu archivo .env "
-            "para habilitar el análisis con IA."
-        )
 
-    prompt = (
+def _construir_prompt(resumen: str) -> str:
+    """Arma el prompt de CFO que acompaña al resumen financiero"""
+    return (
         "Eres un CFO experto en finanzas corporativas. "
         "Analiza el siguiente reporte financiero de INNOVA FINANCE y proporciona:\n\n"
         "1. **Conclusiones clave** (máx. 5 puntos): los hallazgos más importantes.\n"
         "2. **Categorías críticas**: qué áreas de gasto merecen atención urgente y por qué.\n"
         "3. **Interpretación del forecast**: ¿la tendencia es sostenible? ¿hay riesgo de sobrecosto?\n"
         "4. **Recomendaciones accionables** (máx. 3): acciones concretas para optimizar el gasto.\n"
-        "5. **Alertas o riesgos**: señales de alerta que el equipo financiero debe monitorear.\n\n"
+        "5. **Alertas o riesgos**: señales de alerta que el equipo financiero debe monitorear, "
+        "incluyendo las anomalías detectadas si el reporte las lista.\n\n"
         "Sé directo, usa cifras del reporte y evita generalidades.\n\n"
         f"REPORTE:\n{resumen}"
     )
 
+
+def analizar_con_ia(resumen: str) -> str:
+    """Envía el resumen financiero a Claude y retorna conclusiones clave"""
+    if not ANTHROPIC_API_KEY:
+        return MENSAJE_IA_DESACTIVADA
+
     try:
         cliente = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
         respuesta = cliente.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=1024,
-            messages=[{"role": "user", "content": prompt}],
+            model=IA_MODELO,
+            max_tokens=IA_MAX_TOKENS,
+            messages=[{"role": "user", "content": _construir_prompt(resumen)}],
         )
         return respuesta.content[0].text
     except Exception as e: # pylint: disable=broad-exception-caught
@@ -277,8 +502,207 @@ def analizar_con_ia(resumen: str) -> str:
         return f"[Error IA] {e}"
 
 
-def ejecutar_analisis_ia() -> None:
-    """Orquesta clasificación, forecast e interpretación con IA"""
+def analizar_con_ia_streaming(resumen: str) -> Iterator[str]:
+    """
+    - Variante en streaming de 'analizar_con_ia': entrega el texto por fragmentos
+    - El timeout de lectura (IA_TIMEOUT_CHUNK_S) aplica entre fragmentos, no a la respuesta completa
+    """
+    if not ANTHROPIC_API_KEY:
+        yield MENSAJE_IA_DESACTIVADA
+        return
+
+    try:
+        cliente = anthropic.Anthropic(
+            api_key=ANTHROPIC_API_KEY,
+            timeout=anthropic.Timeout(IA_TIMEOUT_CHUNK_S, connect=10.0),
+        )
+        with cliente.messages.stream(
+            model=IA_MODELO,
+            max_tokens=IA_MAX_TOKENS,
+            messages=[{"role": "user", "content": _construir_prompt(resumen)}],
+        ) as stream:
+            yield from stream.text_stream
+    except Exception as e: # pylint: disable=broad-exception-caught
+        logger.error("Error durante el streaming de la API de Anthropic: %s", e)
+        yield f"\n[Error IA] {e}"
+
+
+def guardar_reporte(resumen: str, interpretacion: str, output_path: Path) -> None:
+    """Escribe el resumen y las conclusiones de la IA en el archivo de salida"""
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(resumen)
+        f.write(SEPARADOR_CONCLUSIONES)
+        f.write(interpretacion)
+
+
+def guardar_reporte_streaming(
+    resumen: str, fragmentos: Iterable[str], output_path: Path
+) -> str:
+    """
+    - Escribe primero el resumen determinístico y luego cada fragmento de la IA al llegar
+    - Se escribe sobre '<archivo>.partial' (que puede seguirse con tail) y al terminar
+      se renombra atómicamente al archivo final
+    - Retorna el texto completo de la interpretación
+    """
+    tmp_path = output_path.with_name(output_path.name + ".partial")
+    partes: list[str] = []
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(resumen)
+        f.write(SEPARADOR_CONCLUSIONES)
+        f.flush()
+        for fragmento in fragmentos:
+            f.write(fragmento)
+            f.flush()
+            partes.append(fragmento)
+    os.replace(tmp_path, output_path)
+    return "".join(partes)
+
+
+def calcular_forecast_segmentos(
+    df_gastos: pd.DataFrame,
+    df_ingresos: pd.DataFrame,
+    df_mrr: pd.DataFrame,
+    meses_adelante: int = 3,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    - Forecast por segmento con el motor vectorizado: gastos por país × categoría,
+      ingresos por país y MRR por país × plan
+    - Retorna (forecast tidy de todas las series, margen proyectado por país)
+    """
+    segmentos = {
+        "gastos":   (df_gastos,   ["pais", "category"], "gastos_usd"),
+        "ingresos": (df_ingresos, ["pais"],             "ingresos_usd"),
+        "mrr":      (df_mrr,      ["pais", "plan"],     "mrr_usd"),
+    }
+    forecasts = {
+        serie: forecast_por_segmento(df, claves, col_monto, meses_adelante=meses_adelante)
+        for serie, (df, claves, col_monto) in segmentos.items()
+    }
+    margen_pais = calcular_margen_proyectado(
+        forecasts["ingresos"], forecasts["gastos"], forecasts["mrr"], claves=["pais"]
+    )
+    tidy = pd.concat(
+        [df.assign(serie=serie) for serie, df in forecasts.items()], ignore_index=True
+    ).reindex(columns=["serie", "pais", "category", "plan", "periodo", "forecast_usd"])
+    logger.info(
+        "Forecast por segmento: %d filas, margen proyectado para %d países",
+        len(tidy), margen_pais["pais"].nunique(),
+    )
+    return tidy, margen_pais
+
+
+def guardar_forecast_segmentos(forecast: pd.DataFrame, margen_pais: pd.DataFrame) -> None:
+    """Persiste el forecast por segmento y el margen por país en la BD"""
+    motor = obtener_motor()
+    con = motor.conectar(DB_PATH)
+    try:
+        for tabla, df in ((TABLA_FORECAST_SEGMENTOS, forecast), (TABLA_MARGEN_PAIS, margen_pais)):
+            df = df.assign(periodo=pd.to_datetime(df["periodo"]).dt.strftime("%Y-%m-%d"))
+            motor.escribir_tabla(con, tabla, df)
+            logger.info("Tabla '%s' actualizada: %d filas", tabla, len(df))
+    finally:
+        con.close()
+
+
+def _contexto_series() -> str:
+    """Países que cubren las series (el estado de un subconjunto de países no sirve para otro)"""
+    if PARTICIONADO == "pais":
+        return "paises=" + ",".join(sorted(PAISES_ANALISIS))
+    return ""
+
+
+def _series_principales() -> dict[str, pd.Series]:
+    """Series mensuales completas de totales de gastos, ingresos y MRR"""
+    return {
+        nombre: _serie_mensual(_leer_vista(vista), col_monto=col_monto)
+        for nombre, (vista, col_monto, _) in SERIES_PRINCIPALES.items()
+    }
+
+
+def actualizar_estado_forecast() -> dict[str, dict]:
+    """
+    - Incorpora al estado persistido solo los meses nuevos de cada serie: de las vistas se leen
+      únicamente los periodos posteriores al último registrado y se aplican en O(1) por mes
+    - La historia ya registrada se valida con las huellas por mes de la carga, sin releerla; si
+      cambió (corrección tardía, mes en curso con carga parcial) o no hay huellas, la serie se
+      reconstruye desde la vista completa
+    - Retorna los estados actualizados por nombre de serie
+    """
+    motor = obtener_motor()
+    con = motor.conectar(DB_PATH)
+    try:
+        estados = cargar_estados(con, motor)
+        huellas = leer_huellas_carga(con, motor)
+    finally:
+        con.close()
+
+    contexto = _contexto_series()
+    for nombre, (vista, col_monto, tablas) in SERIES_PRINCIPALES.items():
+        estado = estados.get(nombre)
+        ultimo = None if estado is None else estado["ultimo_periodo"]
+        if estado_vigente(estado, huella_historia(huellas, tablas, ultimo, contexto)):
+            nuevos = _serie_mensual(_leer_vista(vista, desde=ultimo), col_monto)
+            estado = sincronizar_estado(estado, nuevos, nombre)
+            logger.info("[%s] Estado actualizado con %d meses nuevos", nombre, len(nuevos))
+        else:
+            logger.info("[%s] Historia modificada o sin huellas de carga: se reconstruye el estado", nombre)
+            estado = construir_estado(_serie_mensual(_leer_vista(vista), col_monto), nombre)
+        estado["huella_historia"] = huella_historia(huellas, tablas, estado["ultimo_periodo"], contexto)
+        estados[nombre] = estado
+
+    con = motor.conectar(DB_PATH)
+    try:
+        guardar_estados(con, estados, motor)
+    finally:
+        con.close()
+    return estados
+
+
+def reconstruir_estado_forecast() -> list[str]:
+    """
+    - Recalcula el estado desde la historia completa y lo compara con el persistido
+    - Guarda el estado reconstruido y retorna las series cuyo estado no coincidía
+    """
+    motor = obtener_motor()
+    con = motor.conectar(DB_PATH)
+    try:
+        previos = cargar_estados(con, motor)
+        huellas = leer_huellas_carga(con, motor)
+        nuevos = {
+            nombre: construir_estado(serie, nombre)
+            for nombre, serie in _series_principales().items()
+        }
+        for nombre, estado in nuevos.items():
+            estado["huella_historia"] = huella_historia(
+                huellas, SERIES_PRINCIPALES[nombre][2], estado["ultimo_periodo"], _contexto_series()
+            )
+        inconsistentes = []
+        for nombre, estado in nuevos.items():
+            if nombre not in previos:
+                continue
+            diferencias = diferencias_estado(estado, previos[nombre])
+            if diferencias:
+                logger.warning("[%s] Estado inconsistente en: %s", nombre, ", ".join(diferencias))
+                inconsistentes.append(nombre)
+        previos.update(nuevos)
+        guardar_estados(con, previos, motor)
+    finally:
+        con.close()
+    logger.info(
+        "Estado reconstruido: %d series, %d inconsistentes", len(nuevos), len(inconsistentes)
+    )
+    return inconsistentes
+
+
+def ejecutar_analisis_ia(streaming: bool | None = None) -> None:
+    """
+    - Orquesta clasificación, forecast e interpretación con IA
+    - Con streaming (por defecto según IA_STREAMING) el reporte se escribe a medida
+      que llegan los tokens del modelo
+    """
+    if streaming is None:
+        streaming = IA_STREAMING
+
     # 1 → Datos
     df_gastos   = _obtener_gastos()
     df_ingresos = _obtener_ingresos()
@@ -288,47 +712,65 @@ def ejecutar_analisis_ia() -> None:
     resumen_cat = resumen_por_categoria(df_gastos)
     resumen_mrr = resumen_mrr_por_plan(df_mrr)
 
-    # 3 → Series temporales (cada vista tiene su columna de monto)
-    serie_gastos   = _serie_mensual(df_gastos,   col_monto="gastos_usd")
-    serie_ingresos = _serie_mensual(df_ingresos, col_monto="ingresos_usd")
-    serie_mrr      = _serie_mensual(df_mrr,      col_monto="mrr_usd")
+    # 3-4 → Estado incremental: solo se leen y procesan los meses nuevos de cada serie
+    estados = actualizar_estado_forecast()
 
-    # 4 → Tendencias
-    tendencia_gastos   = calcular_tendencia(serie_gastos)
-    tendencia_ingresos = calcular_tendencia(serie_ingresos)
-    tendencia_mrr      = calcular_tendencia(serie_mrr)
+    # 5 → Tendencias y forecasts individuales desde el estado
+    tendencia_gastos   = tendencia_desde_estado(estados["gastos"])
+    tendencia_ingresos = tendencia_desde_estado(estados["ingresos"])
+    tendencia_mrr      = tendencia_desde_estado(estados["mrr"])
 
-    # 5 → Forecasts individuales
-    forecast_gastos   = forecast_lineal(serie_gastos,   meses_adelante=3)
-    forecast_ingresos = forecast_lineal(serie_ingresos, meses_adelante=3)
-    forecast_mrr      = forecast_lineal(serie_mrr,      meses_adelante=3)
+    forecast_gastos   = forecast_desde_estado(estados["gastos"],   meses_adelante=3)
+    forecast_ingresos = forecast_desde_estado(estados["ingresos"], meses_adelante=3)
+    forecast_mrr      = forecast_desde_estado(estados["mrr"],      meses_adelante=3)
 
     # 6 → Margen proyectado consolidado
     margen_proyectado = calcular_margen_proyectado(
         forecast_ingresos, forecast_gastos, forecast_mrr
     )
 
-    # 7 → Resumen textual
-    resumen = construir_resumen(
+    # 6b → Forecast por segmento (opcional, FORECAST_SEGMENTOS=1)
+    if FORECAST_SEGMENTOS:
+        guardar_forecast_segmentos(*calcular_forecast_segmentos(df_gastos, df_ingresos, df_mrr))
+
+    # 7 → Detección de anomalías a nivel de registro (tabla 'anomalias')
+    anomalias = _obtener_anomalias()
+
+    # 8 → Resumen (texto para la IA y secciones tabulares)
+    reporte = construir_reporte(
         df_gastos, df_ingresos, df_mrr,
         resumen_cat, resumen_mrr,
         tendencia_gastos, tendencia_ingresos, tendencia_mrr,
         margen_proyectado,
+        anomalias,
     )
+    resumen = reporte["texto"]
     logger.info("Resumen generado:\n%s", resumen)
 
-    # 8 → IA
-    interpretacion = analizar_con_ia(resumen)
-    logger.info("\n==== CONCLUSIONES IA ====\n%s\n", interpretacion)
-
-    # 9 → Guardar
+    # 9 → IA + 10 → Guardar
     log_dir = Path(os.getenv("LOG_DIR", "logs"))
     log_dir.mkdir(exist_ok=True)
     output_path = log_dir / "analisis_financiero_ia.txt"
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(resumen)
-        f.write("\n\n==== CONCLUSIONES IA ====\n")
-        f.write(interpretacion)
+    if streaming:
+        interpretacion = guardar_reporte_streaming(
+            resumen, analizar_con_ia_streaming(resumen), output_path
+        )
+    else:
+        interpretacion = analizar_con_ia(resumen)
+        guardar_reporte(resumen, interpretacion, output_path)
+    logger.info("\n==== CONCLUSIONES IA ====\n%s\n", interpretacion)
+
+    # 11 → Formatos estructurados (Markdown, JSON, CSV) con las tablas completas
+    secciones = secciones_reporte(
+        resumen_cat, resumen_mrr,
+        tendencia_gastos, tendencia_ingresos, tendencia_mrr,
+        margen_proyectado,
+        anomalias,
+    )
+    rutas = guardar_formatos(
+        renderizar(reporte["metadatos"], secciones, interpretacion), output_path
+    )
+    logger.info("Formatos estructurados: %s", ", ".join(str(r) for r in rutas))
 
     logger.info("Análisis completado. Resultado guardado en '%s'", output_path)
 
@@ -0,0 +1,229 @@
+"""
+Detección de anomalías a nivel de registro en fact_gastos y fact_transacciones.
+
+Implementación:
+- Z-score robusto móvil: cada registro se compara con la mediana y el MAD de los registros
+  previos de su mismo grupo (país × categoría para gastos, país para transacciones)
+- Si el MAD es 0 (montos repetidos: cuotas fijas, nómina) la escala cae a 1.2533·MeanAD y, si
+  también es 0, a un piso relativo a la mediana, para que un pico no quede sin marcar
+- Cálculo vectorizado con NumPy (ventanas deslizantes procesadas por bloques), sin bucles por fila
+- Los registros marcados se guardan en la tabla 'anomalias'; con particiones por país los hechos se
+  leen desde los shards (los grupos incluyen el país, así que la unión es exacta)
+"""
+
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.motor_bd import MotorSQLite, MotorDuckDB, obtener_motor
+
+
+
+
+logger = logging.getLogger("deteccion_anomalias")
+
+TABLA_ANOMALIAS = "anomalias"
+VENTANA = 60
+MIN_OBSERVACIONES = 10
+UMBRAL_Z = 3.5
+FACTOR_MAD = 0.6745
+FACTOR_MEAN_AD = 1.2533
+ESCALA_MINIMA_RELATIVA = 0.01
+TAMANO_BLOQUE = 200_000
+
+FUENTES = {
+    "gastos": {
+        "tabla": "fact_gastos",
+        "llave": "expense_key",
+        "monto": "amount_usd",
+        "grupos": ["country", "category"],
+    },
+    "transacciones": {
+        "tabla": "fact_transacciones",
+        "llave": "transaction_key",
+        "monto": "total_usd",
+        "grupos": ["country"],
+    },
+}
+COLUMNAS_ANOMALIAS = [
+    "origen", "registro_key", "date_key", "country", "category",
+    "monto_usd", "mediana_usd", "mad_usd", "z_robusta",
+]
+
+
+
+
+def zscore_robusto_movil(
+    valores: np.ndarray,
+    grupos: np.ndarray,
+    ventana: int = VENTANA,
+    min_observaciones: int = MIN_OBSERVACIONES,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    - 'valores' y 'grupos' (códigos enteros) deben venir ordenados por (grupo, fecha)
+    - Para cada registro usa los 'ventana' registros anteriores del mismo grupo (sin incluirlo)
+    - z = 0.6745 · (x − mediana) / MAD; con MAD = 0 se usa (x − mediana) / (1.2533 · MeanAD) y,
+      si la ventana es constante, (x − mediana) / (ESCALA_MINIMA_RELATIVA · |mediana|)
+    - z queda NaN si hay < min_observaciones o si la ventana es constante en 0
+    - Retorna (mediana, mad, z)
+    """
+    valores = np.asarray(valores, dtype=float)
+    grupos = np.asarray(grupos)
+    n = len(valores)
+    mediana = np.full(n, np.nan)
+    mad = np.full(n, np.nan)
+    mean_ad = np.full(n, np.nan)
+
+    # La fila i de cada vista corresponde a los registros [i − ventana, i)
+    ventanas_v = sliding_window_view(np.concatenate([np.full(ventana, np.nan), valores]), ventana)
+    ventanas_g = sliding_window_view(np.concatenate([np.full(ventana, -1), grupos]), ventana)
+
+    # Posición de cada registro dentro de su grupo: desde 'ventana' la ventana es completa
+    # (sin mezclar grupos) y basta np.median; solo el inicio de cada grupo requiere máscara
+    inicios = np.r_[True, grupos[1:] != grupos[:-1]]
+    posicion = np.arange(n) - np.maximum.accumulate(np.where(inicios, np.arange(n), 0))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for inicio in range(0, n, TAMANO_BLOQUE):
+            fin = min(inicio + TAMANO_BLOQUE, n)
+            completas = posicion[inicio:fin] >= ventana
+            filas = np.arange(inicio, fin)
+
+            idx = filas[completas]
+            if len(idx):
+                bloque = ventanas_v[idx]
+                med = np.median(bloque, axis=1)
+                desvio = np.abs(bloque - med[:, None])
+                mediana[idx] = med
+                mad[idx] = np.median(desvio, axis=1)
+                ceros = mad[idx] == 0
+                mean_ad[idx[ceros]] = desvio[ceros].mean(axis=1)
+
+            idx = filas[~completas]
+            if len(idx) and min_observaciones <= ventana:
+                bloque = np.where(ventanas_g[idx] == grupos[idx, None], ventanas_v[idx], np.nan)
+                suficientes = posicion[idx] >= min_observaciones
+                idx, bloque = idx[suficientes], bloque[suficientes]
+                med = np.nanmedian(bloque, axis=1)
+                desvio = np.abs(bloque - med[:, None])
+                mediana[idx] = med
+                mad[idx] = np.nanmedian(desvio, axis=1)
+                ceros = mad[idx] == 0
+                mean_ad[idx[ceros]] = np.nanmean(desvio[ceros], axis=1)
+
+    # Escala equivalente a una desviación estándar: MAD/0.6745 → 1.2533·MeanAD → piso relativo
+    escala = np.where(
+        mad > 0,
+        mad / FACTOR_MAD,
+        np.where(mean_ad > 0, FACTOR_MEAN_AD * mean_ad, ESCALA_MINIMA_RELATIVA * np.abs(mediana)),
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(escala > 0, (valores - mediana) / escala, np.nan)
+    return mediana, mad, z
+
+
+def detectar_anomalias_df(
+    df: pd.DataFrame,
+    origen: str,
+    llave: str,
+    monto: str,
+    grupos: list[str],
+    ventana: int = VENTANA,
+    umbral: float = UMBRAL_Z,
+    min_observaciones: int = MIN_OBSERVACIONES,
+) -> pd.DataFrame:
+    """Marca los registros de un DataFrame de hechos cuyo |z robusto| supera el umbral"""
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNAS_ANOMALIAS)
+
+    df = df.sort_values(grupos + ["date_key", llave], kind="stable").reset_index(drop=True)
+    codigos = df.groupby(grupos, sort=False, dropna=False).ngroup().to_numpy()
+    mediana, mad, z = zscore_robusto_movil(
+        df[monto].to_numpy(), codigos, ventana, min_observaciones
+    )
+    marcados = np.abs(np.nan_to_num(z)) > umbral
+
+    resultado = pd.DataFrame({
+        "origen": origen,
+        "registro_key": df.loc[marcados, llave].astype(str).to_numpy(),
+        "date_key": df.loc[marcados, "date_key"].to_numpy(),
+        "country": df.loc[marcados, "country"].to_numpy(),
+        "category": (
+            df.loc[marcados, "category"].to_numpy() if "category" in grupos else None
+        ),
+        "monto_usd": df.loc[marcados, monto].to_numpy(),
+        "mediana_usd": mediana[marcados].round(2),
+        "mad_usd": mad[marcados].round(2),
+        "z_robusta": z[marcados].round(2),
+    })
+    logger.info("[%s] %d de %d registros marcados como anomalías", origen, len(resultado), len(df))
+    return resultado
+
+
+def detectar_anomalias_tablas(
+    tablas: dict[str, pd.DataFrame],
+    ventana: int = VENTANA,
+    umbral: float = UMBRAL_Z,
+    min_observaciones: int = MIN_OBSERVACIONES,
+) -> pd.DataFrame:
+    """
+    - Ejecuta la detección sobre las tablas de hechos ya leídas ({origen: DataFrame})
+    - Retorna las anomalías ordenadas por |z| descendente
+    """
+    resultados = [
+        detectar_anomalias_df(
+            df, origen, FUENTES[origen]["llave"], FUENTES[origen]["monto"],
+            FUENTES[origen]["grupos"], ventana, umbral, min_observaciones,
+        )
+        for origen, df in tablas.items()
+    ]
+    anomalias = (
+        pd.concat(resultados, ignore_index=True)
+        if resultados else pd.DataFrame(columns=COLUMNAS_ANOMALIAS)
+    )
+    return anomalias.iloc[
+        np.argsort(-np.abs(anomalias["z_robusta"].to_numpy(dtype=float)), kind="stable")
+    ].reset_index(drop=True)
+
+
+def columnas_fuente(origen: str) -> list[str]:
+    """Columnas de la tabla de hechos que necesita la detección"""
+    fuente = FUENTES[origen]
+    return [fuente["llave"], "date_key", *fuente["grupos"], fuente["monto"]]
+
+
+def guardar_anomalias(con, anomalias: pd.DataFrame, motor: MotorSQLite | MotorDuckDB | None = None) -> None:
+    """Reemplaza la tabla 'anomalias'"""
+    motor = motor or obtener_motor()
+    motor.escribir_tabla(con, TABLA_ANOMALIAS, anomalias)
+    logger.info("Tabla '%s' actualizada: %d anomalías", TABLA_ANOMALIAS, len(anomalias))
+
+
+def detectar_anomalias(
+    con,
+    ventana: int = VENTANA,
+    umbral: float = UMBRAL_Z,
+    min_observaciones: int = MIN_OBSERVACIONES,
+    motor: MotorSQLite | MotorDuckDB | None = None,
+) -> pd.DataFrame:
+    """
+    - Lee cada tabla de hechos de la BD, ejecuta la detección y guarda el resultado en 'anomalias'
+    - Si falta una tabla de hechos se lanza RuntimeError (no se omite en silencio)
+    """
+    motor = motor or obtener_motor()
+    tablas = {}
+    for origen, fuente in FUENTES.items():
+        try:
+            tablas[origen] = motor.leer(
+                con, f"SELECT {', '.join(columnas_fuente(origen))} FROM {fuente['tabla']}"
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("No se pudo leer %s: %s", fuente["tabla"], e)
+            raise RuntimeError(f"Error leyendo {fuente['tabla']}: {e}") from e
+
+    anomalias = detectar_anomalias_tablas(tablas, ventana, umbral, min_observaciones)
+    guardar_anomalias(con, anomalias, motor)
+    return anomalias
@@ -0,0 +1,242 @@
+"""
+Estado incremental de tendencias y forecasts por serie mensual.
+
+Implementación:
+- Mantiene estadísticos suficientes por serie: n, Σx, Σy, Σxy, Σx², primer/último valor, máx/mín
+- La volatilidad (desviación estándar de la variación % mensual) se acumula con Welford
+- Cada mes nuevo actualiza el estado en O(1), sin releer la historia
+- La historia ya incorporada se valida con las huellas por mes registradas en la carga
+  ('huellas_carga'): una corrección de un mes ya procesado cambia la huella y fuerza la reconstrucción
+- El estado se persiste en la tabla 'estado_forecast' y puede reconstruirse y verificarse desde cero
+"""
+
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+from src.motor_bd import MotorSQLite, MotorDuckDB, obtener_motor
+
+
+
+
+logger = logging.getLogger("estado_forecast")
+
+TABLA_ESTADO = "estado_forecast"
+CAMPOS_ESTADO = [
+    "serie", "n", "suma_x", "suma_y", "suma_xy", "suma_xx",
+    "primer_valor", "ultimo_valor", "max_valor", "min_valor", "ultimo_periodo",
+    "n_variaciones", "media_variacion", "m2_variacion", "huella_historia",
+]
+
+
+
+
+def estado_vacio(serie: str) -> dict:
+    """Estado inicial (sin observaciones) de una serie"""
+    return {
+        "serie": serie,
+        "n": 0,
+        "suma_x": 0.0,
+        "suma_y": 0.0,
+        "suma_xy": 0.0,
+        "suma_xx": 0.0,
+        "primer_valor": None,
+        "ultimo_valor": None,
+        "max_valor": None,
+        "min_valor": None,
+        "ultimo_periodo": None,
+        "n_variaciones": 0,
+        "media_variacion": 0.0,
+        "m2_variacion": 0.0,
+        "huella_historia": None,
+    }
+
+
+def actualizar_estado(estado: dict, periodo: pd.Timestamp, valor: float) -> dict:
+    """
+    - Agrega un mes nuevo al estado en tiempo constante (x = posición del mes en la serie)
+    - Solo se admiten meses posteriores al último registrado; una corrección requiere reconstruir
+    """
+    periodo = pd.Timestamp(periodo)
+    if estado["ultimo_periodo"] is not None and periodo <= estado["ultimo_periodo"]:
+        raise ValueError(
+            f"[{estado['serie']}] El periodo {periodo:%Y-%m} no es posterior a "
+            f"{estado['ultimo_periodo']:%Y-%m}; reconstruye el estado"
+        )
+
+    valor = float(valor)
+    x = float(estado["n"])
+    nuevo = dict(estado)
+    nuevo["n"] = estado["n"] + 1
+    nuevo["suma_x"] = estado["suma_x"] + x
+    nuevo["suma_y"] = estado["suma_y"] + valor
+    nuevo["suma_xy"] = estado["suma_xy"] + x * valor
+    nuevo["suma_xx"] = estado["suma_xx"] + x * x
+
+    if estado["n"] == 0:
+        nuevo["primer_valor"] = valor
+        nuevo["max_valor"] = valor
+        nuevo["min_valor"] = valor
+    else:
+        nuevo["max_valor"] = max(estado["max_valor"], valor)
+        nuevo["min_valor"] = min(estado["min_valor"], valor)
+        # Variación % mes a mes (Welford); se omite si el mes anterior es 0
+        anterior = estado["ultimo_valor"]
+        if anterior != 0:
+            variacion = (valor - anterior) / anterior
+            k = estado["n_variaciones"] + 1
+            delta = variacion - estado["media_variacion"]
+            media = estado["media_variacion"] + delta / k
+            nuevo["n_variaciones"] = k
+            nuevo["media_variacion"] = media
+            nuevo["m2_variacion"] = estado["m2_variacion"] + delta * (variacion - media)
+
+    nuevo["ultimo_valor"] = valor
+    nuevo["ultimo_periodo"] = periodo
+    return nuevo
+
+
+def construir_estado(serie: pd.Series, nombre: str) -> dict:
+    """Construye el estado desde cero recorriendo una serie mensual completa"""
+    estado = estado_vacio(nombre)
+    for periodo, valor in serie.sort_index().items():
+        estado = actualizar_estado(estado, periodo, valor)
+    return estado
+
+
+def huella_historia(
+    huellas: pd.DataFrame, tablas: list[str], hasta: pd.Timestamp | None, contexto: str = ""
+) -> str | None:
+    """
+    - Huella de la historia de una serie hasta el mes 'hasta', a partir de las huellas por mes de
+      sus tablas de origen (una fila por tabla y mes, sin leer los datos)
+    - 'contexto' distingue variantes de la misma serie (p. ej. los países analizados)
+    - None si no hay huellas de esas tablas: el estado no se puede validar
+    """
+    if hasta is None:
+        return None
+    seleccion = huellas[huellas["tabla"].isin(tablas)]
+    if seleccion.empty:
+        return None
+    seleccion = seleccion[seleccion["periodo"] <= f"{hasta:%Y-%m}"].sort_values(["tabla", "periodo"])
+    texto = "|".join(
+        [contexto]
+        + (
+            seleccion["tabla"] + ":" + seleccion["periodo"] + ":"
+            + seleccion["filas"].astype(str) + ":" + seleccion["huella"].astype(str)
+        ).tolist()
+    )
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def estado_vigente(estado: dict | None, huella: str | None) -> bool:
+    """El estado se puede actualizar con los meses nuevos si su historia no cambió desde que se guardó"""
+    return (
+        estado is not None
+        and estado["n"] > 0
+        and huella is not None
+        and estado.get("huella_historia") == huella
+    )
+
+
+def sincronizar_estado(estado: dict | None, nuevos: pd.Series, nombre: str) -> dict:
+    """
+    - Aplica al estado solo los meses de 'nuevos' posteriores a su último periodo (O(1) por mes);
+      'nuevos' puede traer únicamente esos meses
+    - La historia ya registrada no se revisa aquí: se valida antes con 'estado_vigente'
+    """
+    if estado is None or estado["n"] == 0:
+        return construir_estado(nuevos, nombre)
+    for periodo, valor in nuevos[nuevos.index > estado["ultimo_periodo"]].sort_index().items():
+        estado = actualizar_estado(estado, periodo, valor)
+    return estado
+
+
+def tendencia_desde_estado(estado: dict) -> dict:
+    """Mismas métricas que 'calcular_tendencia', calculadas en O(1) desde el estado"""
+    if estado["n"] < 2:
+        return {}
+    primero = estado["primer_valor"]
+    cambio_abs = estado["ultimo_valor"] - primero
+    cambio_pct = (cambio_abs / primero * 100) if primero != 0 else 0
+    k = estado["n_variaciones"]
+    volatilidad = np.sqrt(estado["m2_variacion"] / (k - 1)) if k >= 2 else np.nan
+    return {
+        "media_mensual":    round(estado["suma_y"] / estado["n"], 2),
+        "max_mensual":      round(estado["max_valor"], 2),
+        "min_mensual":      round(estado["min_valor"], 2),
+        "cambio_total_pct": round(cambio_pct, 1),
+        "volatilidad_pct":  round(volatilidad * 100, 1),
+        "n_periodos":       estado["n"],
+    }
+
+
+def forecast_desde_estado(estado: dict, meses_adelante: int = 3) -> pd.DataFrame:
+    """Mismo resultado que 'forecast_lineal', resolviendo la regresión desde las sumas del estado"""
+    n = estado["n"]
+    if n < 3:
+        logger.warning("[%s] Serie demasiado corta para forecast (<3 puntos)", estado["serie"])
+        return pd.DataFrame(columns=["periodo", "forecast_usd"])
+
+    sx, sy = estado["suma_x"], estado["suma_y"]
+    pendiente = (n * estado["suma_xy"] - sx * sy) / (n * estado["suma_xx"] - sx * sx)
+    intercepto = (sy - pendiente * sx) / n
+
+    periodos_futuros = pd.date_range(
+        start=estado["ultimo_periodo"] + pd.DateOffset(months=1),
+        periods=meses_adelante,
+        freq="MS",
+    )
+    x_futuro = np.arange(n, n + meses_adelante)
+    return pd.DataFrame({
+        "periodo": periodos_futuros,
+        "forecast_usd": np.maximum(intercepto + pendiente * x_futuro, 0).round(2),
+    })
+
+
+def diferencias_estado(esperado: dict, actual: dict) -> list[str]:
+    """Lista los campos en que dos estados de la misma serie no coinciden"""
+    diferencias = []
+    for campo in CAMPOS_ESTADO:
+        a, b = esperado.get(campo), actual.get(campo)
+        if isinstance(a, float) and isinstance(b, float):
+            iguales = bool(np.isclose(a, b, rtol=1e-9, atol=1e-6))
+        else:
+            iguales = a == b
+        if not iguales:
+            diferencias.append(campo)
+    return diferencias
+
+
+def cargar_estados(con, motor: MotorSQLite | MotorDuckDB | None = None) -> dict[str, dict]:
+    """Lee la tabla de estado; retorna un dict vacío si todavía no existe"""
+    motor = motor or obtener_motor()
+    if not motor.existe_tabla(con, TABLA_ESTADO):
+        return {}
+    df = motor.leer(con, f"SELECT * FROM {TABLA_ESTADO}")
+    estados = {}
+    for registro in df.to_dict("records"):
+        estado = estado_vacio(registro["serie"])
+        estado.update(registro)
+        estado["n"] = int(estado["n"])
+        estado["n_variaciones"] = int(estado["n_variaciones"])
+        if estado["ultimo_periodo"] is not None:
+            estado["ultimo_periodo"] = pd.Timestamp(estado["ultimo_periodo"])
+        huella = estado["huella_historia"]
+        estado["huella_historia"] = None if pd.isna(huella) else str(huella)
+        estados[estado["serie"]] = estado
+    return estados
+
+
+def guardar_estados(
+    con, estados: dict[str, dict], motor: MotorSQLite | MotorDuckDB | None = None
+) -> None:
+    """Reemplaza la tabla de estado con los estados dados"""
+    motor = motor or obtener_motor()
+    df = pd.DataFrame(list(estados.values()), columns=CAMPOS_ESTADO)
+    df["ultimo_periodo"] = df["ultimo_periodo"].map(
+        lambda p: None if p is None else f"{p:%Y-%m-%d}"
+    )
+    motor.escribir_tabla(con, TABLA_ESTADO, df)
+    logger.info("Estado de %d series guardado en '%s'", len(df), TABLA_ESTADO)
@@ -0,0 +1,179 @@
+"""
+Forecast vectorizado para miles de series (país × categoría × plan).
+
+Implementación:
+- Pivotea los datos mensuales a una matriz (series × meses) con NaN en meses faltantes
+- Ajusta todas las regresiones lineales en una sola pasada de mínimos cuadrados en forma cerrada
+- Soporta meses faltantes por máscara, y variantes estacional (aditiva) y de tendencia amortiguada
+- Retorna un DataFrame "tidy" compatible con 'calcular_margen_proyectado'
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+
+
+
+
+logger = logging.getLogger("forecast_masivo")
+
+MIN_OBSERVACIONES = 3
+PERIODO_ESTACIONAL = 12
+ITERACIONES_ESTACIONALES = 10
+
+
+
+
+def matriz_series(
+    df: pd.DataFrame, claves: list[str], col_monto: str
+) -> tuple[pd.DataFrame, pd.DatetimeIndex, np.ndarray]:
+    """
+    - Convierte una vista mensual (anio, mes, claves..., monto) en una matriz series × meses
+    - Los meses sin dato quedan como NaN (se enmascaran en el ajuste)
+    - Retorna (claves de cada fila, periodos de cada columna, matriz)
+    """
+    df = df.copy()
+    df["periodo"] = pd.to_datetime(
+        df["anio"].astype(str) + "-" + df["mes"].astype(str).str.zfill(2)
+    )
+    tabla = df.pivot_table(
+        index=claves, columns="periodo", values=col_monto, aggfunc="sum"
+    )
+    periodos = pd.date_range(tabla.columns.min(), tabla.columns.max(), freq="MS")
+    tabla = tabla.reindex(columns=periodos)
+    return tabla.index.to_frame(index=False), periodos, tabla.to_numpy(dtype=float)
+
+
+def ajustar_lineal_lote(valores: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    - Regresión lineal y = a + b·x para cada fila de 'valores' (series × meses), x = índice del mes
+    - Los NaN se excluyen mediante una máscara; todo se resuelve con sumas vectorizadas
+    - Retorna (intercepto, pendiente, n_observaciones); filas con < MIN_OBSERVACIONES quedan en NaN
+    """
+    mascara = ~np.isnan(valores)
+    w = mascara.astype(float)
+    y = np.where(mascara, valores, 0.0)
+    x = np.arange(valores.shape[1], dtype=float)
+
+    n = w.sum(axis=1)
+    sx = w @ x
+    sxx = w @ (x * x)
+    sy = y.sum(axis=1)
+    sxy = y @ x
+
+    denominador = n * sxx - sx * sx
+    validas = (n >= MIN_OBSERVACIONES) & (denominador != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pendiente = np.where(validas, (n * sxy - sx * sy) / denominador, np.nan)
+        intercepto = np.where(validas, (sy - pendiente * sx) / n, np.nan)
+    return intercepto, pendiente, n
+
+
+def _indices_estacionales(
+    valores: np.ndarray, intercepto: np.ndarray, pendiente: np.ndarray, periodo: int
+) -> np.ndarray:
+    """
+    - Índices estacionales aditivos (series × periodo) a partir de los residuos de la tendencia
+    - Solo se aplican a series con al menos dos ciclos completos observados; el resto queda en 0
+    - Los índices se centran para que sumen 0 en cada serie
+    """
+    n_series, n_meses = valores.shape
+    x = np.arange(n_meses, dtype=float)
+    residuos = valores - (intercepto[:, None] + pendiente[:, None] * x)
+    fase = np.arange(n_meses) % periodo
+
+    indices = np.zeros((n_series, periodo))
+    for f in range(periodo):
+        columnas = residuos[:, fase == f]
+        conteo = (~np.isnan(columnas)).sum(axis=1)
+        suma = np.nansum(columnas, axis=1)
+        indices[:, f] = np.where(conteo > 0, suma / np.maximum(conteo, 1), 0.0)
+
+    indices -= indices.mean(axis=1, keepdims=True)
+    suficientes = (~np.isnan(valores)).sum(axis=1) >= 2 * periodo
+    indices[~suficientes | np.isnan(pendiente)] = 0.0
+    return indices
+
+
+def forecast_lote(
+    valores: np.ndarray,
+    meses_adelante: int = 3,
+    estacional: bool = False,
+    amortiguamiento: float | None = None,
+    periodo_estacional: int = PERIODO_ESTACIONAL,
+) -> np.ndarray:
+    """
+    - Proyecta 'meses_adelante' para cada serie de la matriz (series × meses)
+    - estacional: suma índices estacionales aditivos a la tendencia lineal
+    - amortiguamiento (phi en (0, 1)): la pendiente se amortigua como Σ phi^h (damped trend)
+    - Retorna una matriz (series × meses_adelante), recortada en 0 y con NaN en series sin ajuste
+    """
+    n_meses = valores.shape[1]
+    intercepto, pendiente, _ = ajustar_lineal_lote(valores)
+
+    indices = np.zeros((valores.shape[0], periodo_estacional))
+    if estacional:
+        # Se alterna entre índices estacionales y tendencia desestacionalizada (backfitting)
+        # para que la estacionalidad no sesgue la pendiente
+        fases = np.arange(n_meses) % periodo_estacional
+        for _ in range(ITERACIONES_ESTACIONALES):
+            indices = _indices_estacionales(valores, intercepto, pendiente, periodo_estacional)
+            intercepto, pendiente, _ = ajustar_lineal_lote(valores - indices[:, fases])
+
+    h = np.arange(1, meses_adelante + 1, dtype=float)
+    if amortiguamiento is None:
+        pasos = h
+    else:
+        if not 0 < amortiguamiento < 1:
+            raise ValueError("El amortiguamiento debe estar en el intervalo (0, 1)")
+        pasos = np.cumsum(amortiguamiento ** h)
+
+    nivel_final = intercepto + pendiente * (n_meses - 1)
+    fases_futuras = np.arange(n_meses, n_meses + meses_adelante) % periodo_estacional
+    resultado = (
+        nivel_final[:, None] + pendiente[:, None] * pasos + indices[:, fases_futuras]
+    )
+    return np.maximum(resultado, 0).round(2)
+
+
+def forecast_por_segmento(
+    df: pd.DataFrame,
+    claves: list[str],
+    col_monto: str,
+    meses_adelante: int = 3,
+    estacional: bool = False,
+    amortiguamiento: float | None = None,
+) -> pd.DataFrame:
+    """
+    - Forecast de todas las combinaciones de 'claves' (p. ej. ['pais', 'category']) en una pasada
+    - Retorna un DataFrame tidy: claves..., periodo, forecast_usd (una fila por serie y mes futuro)
+    - Las series con < MIN_OBSERVACIONES meses observados se omiten
+    """
+    columnas = claves + ["periodo", "forecast_usd"]
+    if df.empty:
+        return pd.DataFrame(columns=columnas)
+
+    df_claves, periodos, valores = matriz_series(df, claves, col_monto)
+    forecast = forecast_lote(
+        valores,
+        meses_adelante=meses_adelante,
+        estacional=estacional,
+        amortiguamiento=amortiguamiento,
+    )
+    periodos_futuros = pd.date_range(
+        start=periodos[-1] + pd.DateOffset(months=1),
+        periods=meses_adelante,
+        freq="MS",
+    )
+
+    resultado = df_claves.loc[df_claves.index.repeat(meses_adelante)].reset_index(drop=True)
+    resultado["periodo"] = np.tile(periodos_futuros, len(df_claves))
+    resultado["forecast_usd"] = forecast.ravel()
+
+    omitidas = int(np.isnan(forecast[:, 0]).sum()) if meses_adelante else 0
+    if omitidas:
+        logger.warning(
+            "%d series con menos de %d meses observados: sin forecast",
+            omitidas, MIN_OBSERVACIONES,
+        )
+    return resultado.dropna(subset=["forecast_usd"]).reset_index(drop=True)[columnas]
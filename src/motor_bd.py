@@ -0,0 +1,115 @@
+"""
+Abstracción del motor de base de datos del warehouse.
+
+Implementación:
+- SQLite (por defecto): archivo 'data/innova_finance.db', ejecutor orientado a filas
+- DuckDB (opcional, en proceso y sin servidor): archivo 'data/innova_finance.duckdb', ejecutor
+  columnar y vectorizado, más rápido en los GROUP BY y range-joins de las vistas de reporting
+- El motor se elige con la variable de entorno MOTOR_BD ("sqlite" | "duckdb")
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+import pandas as pd
+
+
+
+
+MOTOR_BD = os.getenv("MOTOR_BD", "sqlite")
+
+
+
+
+class MotorSQLite:
+    """Operaciones del warehouse sobre SQLite"""
+
+    nombre = "sqlite"
+    sufijo = ".db"
+    errores: tuple[type[Exception], ...] = (sqlite3.Error,)
+
+    def ruta(self, ruta_base: Path) -> Path:
+        """Ruta del archivo de BD para este motor"""
+        return Path(ruta_base).with_suffix(self.sufijo)
+
+    def conectar(self, ruta_base: Path):
+        """Abre una conexión al archivo de BD"""
+        return sqlite3.connect(self.ruta(ruta_base))
+
+    def leer(self, con, sql: str, params: tuple = ()) -> pd.DataFrame:
+        """Ejecuta una consulta y retorna el resultado como DataFrame"""
+        return pd.read_sql(sql, con, params=params or None)
+
+    def escribir_tabla(self, con, tabla: str, df: pd.DataFrame) -> None:
+        """Crea o reemplaza una tabla con el contenido de un DataFrame"""
+        df.to_sql(tabla, con, if_exists="replace", index=False)
+
+    def existe_tabla(self, con, tabla: str) -> bool:
+        """Indica si una tabla existe en la BD"""
+        return con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (tabla,)
+        ).fetchone() is not None
+
+
+class MotorDuckDB:
+    """Operaciones del warehouse sobre DuckDB (dependencia opcional 'duckdb')"""
+
+    nombre = "duckdb"
+    sufijo = ".duckdb"
+
+    @staticmethod
+    def _duckdb():
+        try:
+            import duckdb  # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise ImportError(
+                "MOTOR_BD=duckdb requiere el paquete 'duckdb' (pip install duckdb)"
+            ) from e
+        return duckdb
+
+    @property
+    def errores(self) -> tuple[type[Exception], ...]:
+        """Excepciones de base de datos propias del motor"""
+        return (self._duckdb().Error,)
+
+    def ruta(self, ruta_base: Path) -> Path:
+        """Ruta del archivo de BD para este motor"""
+        return Path(ruta_base).with_suffix(self.sufijo)
+
+    def conectar(self, ruta_base: Path):
+        """Abre una conexión al archivo de BD"""
+        return self._duckdb().connect(str(self.ruta(ruta_base)))
+
+    def leer(self, con, sql: str, params: tuple = ()) -> pd.DataFrame:
+        """Ejecuta una consulta y retorna el resultado como DataFrame"""
+        return con.execute(sql, list(params)).df()
+
+    def escribir_tabla(self, con, tabla: str, df: pd.DataFrame) -> None:
+        """Crea o reemplaza una tabla con el contenido de un DataFrame (sin pasar por filas)"""
+        con.register("_df_carga", df)
+        try:
+            con.execute(f'CREATE OR REPLACE TABLE "{tabla}" AS SELECT * FROM _df_carga')
+        finally:
+            con.unregister("_df_carga")
+
+    def existe_tabla(self, con, tabla: str) -> bool:
+        """Indica si una tabla existe en la BD"""
+        return con.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = ?", [tabla]
+        ).fetchone() is not None
+
+
+MOTORES = {
+    "sqlite": MotorSQLite,
+    "duckdb": MotorDuckDB,
+}
+
+
+
+
+def obtener_motor(nombre: str | None = None) -> MotorSQLite | MotorDuckDB:
+    """Retorna el motor configurado (MOTOR_BD) o el indicado por nombre"""
+    nombre = (nombre or MOTOR_BD).lower()
+    if nombre not in MOTORES:
+        raise ValueError(f"Motor de BD no soportado: {nombre} (usa {sorted(MOTORES)})")
+    return MOTORES[nombre]()
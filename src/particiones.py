@@ -0,0 +1,304 @@
+"""
+Almacenamiento particionado del warehouse (una BD SQLite por país).
+
+Implementación:
+- Cada partición (shard) es un archivo SQLite independiente, escrito en paralelo por procesos separados
+- Un catálogo registra las particiones, sus tablas, filas y huella de contenido; solo se reescriben
+  los shards cuyo contenido cambió (p. ej. una corrección tardía de un país)
+- La fachada de consulta abre solo los shards que la consulta necesita (poda de particiones), cada
+  uno con su propia conexión: las vistas que construye dbt referencian "main"."tabla" y SQLite no
+  permite adjuntarlas (ATTACH) bajo otro alias
+- Las filas sin valor de partición van al shard SIN_VALOR, que se conserva pero no se transforma
+  ni se consulta por defecto
+- El catálogo también registra la última construcción (dbt) de cada shard, para transformar solo
+  los shards cuyo contenido o proyecto dbt cambió
+"""
+
+import os
+import re
+import logging
+import sqlite3
+from contextlib import contextmanager
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+
+
+
+
+logger = logging.getLogger("particiones")
+
+DIR_PARTICIONES = Path(os.getenv("DIR_PARTICIONES", "data/particiones"))
+CLAVES_PARTICION = ("pais",)
+VALOR_SIN_PARTICION = "SIN_VALOR"
+
+# Vistas de reporting agrupadas por país: la unión de los resultados por shard es exacta
+VISTAS_POR_PAIS = {
+    "vw_gastos_mensuales",
+    "vw_ingresos_mensuales",
+    "vw_mrr_mensual",
+    "vw_nuevos_clientes_trimestrales",
+}
+
+
+
+
+def _ruta_catalogo() -> Path:
+    return DIR_PARTICIONES / "catalogo.db"
+
+
+def ruta_particion(clave: str, valor: str) -> Path:
+    """Ruta del archivo SQLite de una partición"""
+    nombre = re.sub(r"[^A-Za-z0-9_-]", "_", str(valor)) or VALOR_SIN_PARTICION
+    return DIR_PARTICIONES / clave / f"{nombre}.db"
+
+
+def _huella(tablas: dict[str, pd.DataFrame]) -> str:
+    """Huella del contenido de un shard (hash vectorizado de pandas por tabla)"""
+    partes = []
+    for tabla in sorted(tablas):
+        df = tablas[tabla]
+        hash_filas = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        partes.append(f"{tabla}:{len(df)}:{int(hash_filas.sum(dtype='uint64'))}:{','.join(map(str, df.columns))}")
+    return "|".join(partes)
+
+
+def _escribir_shard(ruta: str, tablas: dict[str, pd.DataFrame]) -> str:
+    """Escribe un shard completo en un archivo temporal y lo reemplaza atómicamente"""
+    tmp = Path(ruta + ".tmp")
+    tmp.unlink(missing_ok=True)
+    con = sqlite3.connect(tmp)
+    try:
+        for tabla, df in tablas.items():
+            df.to_sql(tabla, con, if_exists="replace", index=False)
+    finally:
+        con.close()
+    os.replace(tmp, ruta)
+    return ruta
+
+
+def _conectar_catalogo() -> sqlite3.Connection:
+    DIR_PARTICIONES.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(_ruta_catalogo())
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS particiones (
+            clave TEXT,
+            valor TEXT,
+            ruta TEXT,
+            tabla TEXT,
+            filas INTEGER,
+            huella TEXT,
+            actualizado_en TEXT,
+            PRIMARY KEY (clave, valor, tabla)
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS construcciones (
+            clave TEXT,
+            valor TEXT,
+            huella TEXT,
+            version TEXT,
+            construido_en TEXT,
+            PRIMARY KEY (clave, valor)
+        )
+        """
+    )
+    return con
+
+
+def listar_particiones(clave: str | None = None) -> pd.DataFrame:
+    """Retorna el catálogo (una fila por partición y tabla)"""
+    if not _ruta_catalogo().exists():
+        return pd.DataFrame(
+            columns=["clave", "valor", "ruta", "tabla", "filas", "huella", "actualizado_en"]
+        )
+    con = _conectar_catalogo()
+    try:
+        if clave is None:
+            return pd.read_sql("SELECT * FROM particiones ORDER BY clave, valor, tabla", con)
+        return pd.read_sql(
+            "SELECT * FROM particiones WHERE clave = ? ORDER BY valor, tabla", con, params=(clave,)
+        )
+    finally:
+        con.close()
+
+
+def escribir_particiones(
+    particiones: dict[str, dict[str, pd.DataFrame]],
+    clave: str,
+    max_procesos: int | None = None,
+) -> list[str]:
+    """
+    - Escribe cada partición {valor: {tabla: df}} en su propio archivo, en procesos paralelos
+    - Solo reescribe los shards cuya huella de contenido cambió respecto al catálogo
+    - Retorna los valores de partición reescritos
+    """
+    if clave not in CLAVES_PARTICION:
+        raise ValueError(f"Clave de partición no soportada: {clave} (usa {CLAVES_PARTICION})")
+
+    catalogo = listar_particiones(clave)
+    huellas_previas = catalogo.groupby("valor")["huella"].first().to_dict()
+
+    pendientes = {}
+    for valor, tablas in particiones.items():
+        huella = _huella(tablas)
+        ruta = ruta_particion(clave, valor)
+        if huellas_previas.get(valor) == huella and ruta.exists():
+            continue
+        pendientes[valor] = (ruta, tablas, huella)
+    logger.info(
+        "Particiones por '%s': %d en total, %d a reescribir",
+        clave, len(particiones), len(pendientes),
+    )
+    if not pendientes:
+        return []
+
+    (DIR_PARTICIONES / clave).mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+        futuros = {
+            valor: pool.submit(_escribir_shard, str(ruta), tablas)
+            for valor, (ruta, tablas, _) in pendientes.items()
+        }
+        for valor, futuro in futuros.items():
+            futuro.result()
+            logger.info("Partición '%s=%s' escrita.", clave, valor)
+
+    ahora = datetime.now().isoformat(timespec="seconds")
+    con = _conectar_catalogo()
+    try:
+        with con:
+            for valor, (ruta, tablas, huella) in pendientes.items():
+                con.execute("DELETE FROM particiones WHERE clave = ? AND valor = ?", (clave, valor))
+                con.executemany(
+                    "INSERT INTO particiones VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (clave, valor, str(ruta), tabla, len(df), huella, ahora)
+                        for tabla, df in tablas.items()
+                    ],
+                )
+    finally:
+        con.close()
+    return list(pendientes)
+
+
+def seleccionar_particiones(clave: str, valores: list[str] | None = None) -> pd.DataFrame:
+    """
+    - Particiones del catálogo que necesita la consulta (poda por valor)
+    - Sin 'valores' se excluye el shard SIN_VALOR (filas que no se pueden atribuir a un valor)
+    """
+    catalogo = listar_particiones(clave)[["valor", "ruta"]].drop_duplicates()
+    if valores is None:
+        catalogo = catalogo[catalogo["valor"] != VALOR_SIN_PARTICION]
+    else:
+        catalogo = catalogo[catalogo["valor"].isin([str(v) for v in valores])]
+    return catalogo.reset_index(drop=True)
+
+
+def particiones_pendientes(clave: str, version: str = "") -> pd.DataFrame:
+    """
+    - Particiones (sin SIN_VALOR) que deben construirse: nunca construidas, con contenido distinto
+      al de su última construcción o construidas con otra 'version' (p. ej. la huella del proyecto dbt)
+    - Retorna las columnas 'valor' y 'ruta'
+    """
+    catalogo = listar_particiones(clave)
+    catalogo = (
+        catalogo[catalogo["valor"] != VALOR_SIN_PARTICION]
+        .groupby("valor", as_index=False)[["ruta", "huella"]].first()
+    )
+    con = _conectar_catalogo()
+    try:
+        construidas = pd.read_sql(
+            "SELECT valor, huella AS huella_construida, version FROM construcciones WHERE clave = ?",
+            con, params=(clave,),
+        )
+    finally:
+        con.close()
+    catalogo = catalogo.merge(construidas, on="valor", how="left")
+    pendientes = (catalogo["huella"] != catalogo["huella_construida"]) | (catalogo["version"] != version)
+    return catalogo.loc[pendientes, ["valor", "ruta"]].reset_index(drop=True)
+
+
+def registrar_construccion(clave: str, valores: list[str], version: str = "") -> None:
+    """Registra que los shards 'valores' se construyeron con su contenido actual y 'version'"""
+    ahora = datetime.now().isoformat(timespec="seconds")
+    huellas = listar_particiones(clave).groupby("valor")["huella"].first()
+    con = _conectar_catalogo()
+    try:
+        with con:
+            con.executemany(
+                "INSERT OR REPLACE INTO construcciones VALUES (?, ?, ?, ?, ?)",
+                [(clave, valor, huellas[valor], version, ahora) for valor in valores],
+            )
+    finally:
+        con.close()
+
+
+def _leer_shard(ruta: str, objeto: str, filtro: str = "", params: tuple = ()) -> pd.DataFrame:
+    """Lee una tabla o vista de un shard (opcionalmente con un WHERE) con su propia conexión de solo lectura"""
+    con = sqlite3.connect(f"{Path(ruta).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        where = f" WHERE {filtro}" if filtro else ""
+        return pd.read_sql(f"SELECT * FROM {objeto}{where}", con, params=params or None)
+    finally:
+        con.close()
+
+
+@contextmanager
+def abrir_particiones(
+    objetos: list[str], valores: list[str] | None = None, clave: str = "pais"
+) -> Iterator[sqlite3.Connection]:
+    """
+    - Conexión en memoria para consultas SQL ad hoc sobre varios shards
+    - Cada tabla o vista de 'objetos' se materializa como tabla TEMP con la unión de los shards
+      necesarios (leídos con 'leer_particionado')
+    """
+    con = sqlite3.connect(":memory:")
+    try:
+        for objeto in objetos:
+            leer_particionado(objeto, valores, clave).to_sql(
+                objeto, con, schema="temp", index=False
+            )
+        yield con
+    finally:
+        con.close()
+
+
+def leer_particionado(
+    objeto: str,
+    valores: list[str] | None = None,
+    clave: str = "pais",
+    filtro: str = "",
+    params: tuple = (),
+) -> pd.DataFrame:
+    """
+    - Lee una tabla o vista desde los shards necesarios (una conexión por shard) y une los resultados
+    - 'filtro' es una condición WHERE (con parámetros '?') que se aplica en cada shard
+    - Para vistas de reporting solo se admiten las agrupadas por país (la unión es exacta)
+    - ValueError si algún valor pedido no tiene shard (p. ej. un país mal escrito) o si no hay
+      particiones registradas: un resultado sin columnas rompería a quien lo consuma
+    """
+    if objeto.startswith("vw_") and (clave != "pais" or objeto not in VISTAS_POR_PAIS):
+        raise ValueError(
+            f"La vista '{objeto}' no se puede reconstruir uniendo particiones por '{clave}'"
+        )
+
+    seleccion = seleccionar_particiones(clave, valores)
+    if valores is not None:
+        desconocidos = sorted({str(v) for v in valores} - set(seleccion["valor"]))
+        if desconocidos:
+            disponibles = sorted(set(seleccionar_particiones(clave)["valor"]))
+            raise ValueError(
+                f"Sin partición por '{clave}' para: {', '.join(desconocidos)} "
+                f"(disponibles: {', '.join(disponibles) or 'ninguna'})"
+            )
+    if seleccion.empty:
+        raise ValueError(f"No hay particiones por '{clave}' registradas en el catálogo")
+    resultados = [_leer_shard(ruta, objeto, filtro, params) for ruta in seleccion["ruta"]]
+
+    logger.info("'%s' leída desde %d particiones por '%s'", objeto, len(seleccion), clave)
+    return pd.concat(resultados, ignore_index=True)
@@ -2,11 +2,15 @@
 Pipeline ETL principal: Extracción → Validación → Transformación → Carga
 """
 
+import os
 from pathlib import Path
 import logging
-import sqlite3
+import numpy as np
 import pandas as pd
 
+from src.motor_bd import obtener_motor
+from src.particiones import VALOR_SIN_PARTICION, escribir_particiones
+
 
 
 
@@ -14,19 +18,57 @@ logger = logging.getLogger("extraccion")
 
 RAW_DIR = Path("data/raw")
 DB_PATH = Path("data/innova_finance.db")
+ARCHIVO_TASAS = "fx_rates.csv"
+MONEDA_BASE = "USD"
+PARTICIONADO = os.getenv("PARTICIONADO", "")    # "" (una sola BD) o "pais" (un shard por país)
+
+ARCHIVOS_RAW = {
+    "transacciones":    "transactions.csv",
+    "pagos":            "payments.csv",
+    "gastos":           "expenses.csv",
+    "clientes":         "customers.csv",
+    "empleados":        "employees.csv",
+    "suscripciones":    "subscriptions.csv",
+}
+TABLAS_RAW = {
+    "transacciones":    "raw_transacciones",
+    "pagos":            "raw_pagos",
+    "gastos":           "raw_gastos",
+    "clientes":         "raw_clientes",
+    "empleados":        "raw_empleados",
+    "suscripciones":    "raw_suscripciones",
+    "tasas_cambio":     "raw_tasas_cambio",
+}
+# Columna de fecha que define el mes de cada fila (huellas de carga)
+COLUMNAS_PERIODO = {
+    "transacciones":    "date",
+    "pagos":            "payment_date",
+    "gastos":           "date",
+    "clientes":         "registration_date",
+    "empleados":        "hire_date",
+    "suscripciones":    "start_date",
+}
+# Huellas por tabla y mes del contenido cargado: permiten detectar correcciones de meses ya
+# procesados sin releer la historia (estado incremental de forecast)
+TABLA_HUELLAS = "huellas_carga"
+COLUMNAS_HUELLAS = ["tabla", "periodo", "filas", "huella"]
 
+# Por tabla: columna de fecha para el as-of y mapeo columna local → columna USD
+COLUMNAS_FX = {
+    "transacciones":    ("date", {"total_local": "total_usd", "unit_price_local": "unit_price_usd"}),
+    "pagos":            ("payment_date", {"amount_local": "amount_usd"}),
+    "gastos":           ("date", {"amount_local": "amount_usd"}),
+    "suscripciones":    ("start_date", {"monthly_price_local": "monthly_price_usd"}),
+}
 
 
 
-def extraer_datos() -> dict[str, pd.DataFrame]:
-    """Lee todos los CSV crudos y los retorna como un diccionario de DataFrames"""
+
+def extraer_datos(nombres: list[str] | None = None) -> dict[str, pd.DataFrame]:
+    """Lee los CSV crudos (todos, o solo los de 'nombres') y los retorna como un diccionario de DataFrames"""
     archivos = {
-        "transacciones":    "transactions.csv",
-        "pagos":            "payments.csv",
-        "gastos":           "expenses.csv",
-        "clientes":         "customers.csv",
-        "empleados":        "employees.csv",
-        "suscripciones":    "subscriptions.csv",
+        nombre: archivo for nombre, archivo in ARCHIVOS_RAW.items()
+        if nombres is None or nombre in nombres
     }
     datos: dict[str, pd.DataFrame] = {}
 
@@ -61,13 +103,15 @@ def validar_datos(datos: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
         "clientes":         ["registration_date"],
         "empleados":        ["hire_date"],
         "suscripciones":    ["start_date", "end_date"],
+        "tasas_cambio":     ["date"],
     }
     columnas_monto_positivo = {
-        "transacciones":    ["total_usd", "unit_price_usd", "quantity"],
-        "pagos":            ["amount_usd"],
-        "gastos":           ["amount_usd"],
+        "transacciones":    ["total_usd", "unit_price_usd", "quantity", "total_local", "unit_price_local"],
+        "pagos":            ["amount_usd", "amount_local"],
+        "gastos":           ["amount_usd", "amount_local"],
         "empleados":        ["salary_usd"],
-        "suscripciones":    ["monthly_price_usd"],
+        "suscripciones":    ["monthly_price_usd", "monthly_price_local"],
+        "tasas_cambio":     ["usd_rate"],
     }
 
     for nombre, df in datos.items():
@@ -93,7 +137,8 @@ def validar_datos(datos: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
                     logger.warning(
                         "[%s] %d valores negativos en '%s' → eliminados", nombre, negativos, col
                     )
-                    df = df[df[col] >= 0]
+                    # Los nulos (montos de la otra moneda en un feed mixto) se conservan
+                    df = df[~(df[col] < 0)]
 
         datos[nombre] = df
         logger.info("[%s] Validación completada: %d filas", nombre, len(df))
@@ -101,34 +146,271 @@ def validar_datos(datos: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
     return datos
 
 
-def cargar_datos(datos: dict[str, pd.DataFrame]) -> None:
-    """Carga los DataFrames validados en SQLite como tablas de información cruda"""
-    con = None
-    tabla_map = {
-        "transacciones":    "raw_transacciones",
-        "pagos":            "raw_pagos",
-        "gastos":           "raw_gastos",
-        "clientes":         "raw_clientes",
-        "empleados":        "raw_empleados",
-        "suscripciones":    "raw_suscripciones",
+def extraer_tasas_cambio() -> pd.DataFrame | None:
+    """
+    - Lee la tabla local de tasas diarias (date, currency, usd_rate), si existe
+    - usd_rate = USD por unidad de moneda local (monto_usd = monto_local × usd_rate)
+    """
+    ruta = RAW_DIR / ARCHIVO_TASAS
+    if not ruta.exists():
+        logger.info("No se encontró '%s': se asume que todos los montos están en USD.", ruta)
+        return None
+    tasas = pd.read_csv(ruta)
+    faltantes = {"date", "currency", "usd_rate"} - set(tasas.columns)
+    if faltantes:
+        raise ValueError(f"Faltan columnas en {ARCHIVO_TASAS}: {sorted(faltantes)}")
+    logger.info("Tasas de cambio: %d filas, %d monedas", len(tasas), tasas["currency"].nunique())
+    return tasas
+
+
+def tasas_asof(
+    fechas: pd.Series, monedas: pd.Series, tasas: pd.DataFrame
+) -> np.ndarray:
+    """
+    - Tasa vigente de cada fila: la última de su moneda con fecha igual o anterior (as-of)
+    - Vectorizado con searchsorted sobre las tasas ordenadas de cada moneda (sin búsquedas por fila)
+    - Moneda vacía o USD → 1.0; sin tasa previa → NaN
+    """
+    resultado = np.full(len(fechas), np.nan)
+    f = pd.to_datetime(fechas, errors="coerce").to_numpy(dtype="datetime64[ns]")
+    codigos, monedas_unicas = pd.factorize(
+        monedas.fillna(MONEDA_BASE).astype(str).str.strip().str.upper()
+    )
+
+    tasas = tasas.assign(
+        date=pd.to_datetime(tasas["date"], errors="coerce"),
+        currency=tasas["currency"].astype(str).str.strip().str.upper(),
+    ).dropna(subset=["date", "usd_rate"])
+    por_moneda = {
+        moneda: grupo.sort_values("date", kind="stable")
+        for moneda, grupo in tasas.groupby("currency")
     }
+
+    for i, moneda in enumerate(monedas_unicas):
+        filas = np.flatnonzero(codigos == i)
+        if moneda == MONEDA_BASE:
+            resultado[filas] = 1.0
+            continue
+        if moneda not in por_moneda:
+            continue
+        grupo = por_moneda[moneda]
+        fechas_tasa = grupo["date"].to_numpy(dtype="datetime64[ns]")
+        pos = np.searchsorted(fechas_tasa, f[filas], side="right") - 1
+        validas = (pos >= 0) & ~np.isnat(f[filas])
+        resultado[filas[validas]] = grupo["usd_rate"].to_numpy(dtype=float)[pos[validas]]
+    return resultado
+
+
+def normalizar_monedas(
+    datos: dict[str, pd.DataFrame], tasas: pd.DataFrame | None
+) -> dict[str, pd.DataFrame]:
+    """
+    - Convierte a USD los montos en moneda local de las tablas que traen columna 'currency'
+    - Conserva la moneda, el monto original (*_local), la tasa aplicada (fx_rate_usd) y el monto USD
+    - Las filas que ya traen el monto en USD (sin monto local) se conservan tal cual
+    """
+    for nombre, (col_fecha, columnas) in COLUMNAS_FX.items():
+        df = datos.get(nombre)
+        if df is None or "currency" not in df.columns:
+            continue
+        if tasas is None:
+            raise FileNotFoundError(
+                f"[{nombre}] Trae montos en moneda local pero falta el archivo {ARCHIVO_TASAS}"
+            )
+
+        df = df.copy()
+        df["fx_rate_usd"] = tasas_asof(df[col_fecha], df["currency"], tasas)
+        for col_local, col_usd in columnas.items():
+            if col_local not in df.columns:
+                continue
+            convertido = (df[col_local] * df["fx_rate_usd"]).round(2)
+            if col_usd in df.columns:
+                df[col_usd] = convertido.where(df[col_local].notna(), df[col_usd])
+            else:
+                df[col_usd] = convertido
+
+        sin_tasa = (df["fx_rate_usd"].isna() & df["currency"].notna()).sum()
+        if sin_tasa:
+            logger.warning("[%s] %d filas sin tasa de cambio vigente → monto USD nulo", nombre, sin_tasa)
+        datos[nombre] = df
+        logger.info("[%s] Normalización FX completada: %d filas", nombre, len(df))
+
+    return datos
+
+
+def huellas_por_mes(nombre: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    - Huella del contenido de una tabla por mes: (tabla, periodo 'YYYY-MM', filas, huella)
+    - Suma de los hashes por fila de pandas: cambia si se agrega, corrige o elimina una fila del mes
+    - Las filas sin fecha y las tablas sin columna de periodo no generan huellas
+    """
+    col = COLUMNAS_PERIODO.get(nombre)
+    if col is None or col not in df.columns or df.empty:
+        return pd.DataFrame(columns=COLUMNAS_HUELLAS)
+    periodo = pd.to_datetime(df[col], errors="coerce").dt.strftime("%Y-%m")
+    hashes = pd.Series(pd.util.hash_pandas_object(df, index=False).to_numpy(), index=df.index)
+    return pd.DataFrame(
+        [
+            (TABLAS_RAW[nombre], mes, len(h), str(int(h.to_numpy().sum(dtype="uint64"))))
+            for mes, h in hashes.groupby(periodo.to_numpy())
+        ],
+        columns=COLUMNAS_HUELLAS,
+    )
+
+
+def leer_huellas_carga(con, motor=None) -> pd.DataFrame:
+    """Huellas por tabla y mes registradas en la carga (vacío si aún no existen)"""
+    motor = motor or obtener_motor()
+    if not motor.existe_tabla(con, TABLA_HUELLAS):
+        return pd.DataFrame(columns=COLUMNAS_HUELLAS)
+    return motor.leer(con, f"SELECT * FROM {TABLA_HUELLAS}").astype({"huella": str})
+
+
+def registrar_huellas(datos: dict[str, pd.DataFrame], con=None) -> None:
+    """
+    - Reemplaza en la tabla 'huellas_carga' las huellas por mes de las tablas cargadas
+    - Las huellas de las demás tablas se conservan (cargas parciales del modo watch)
+    """
+    propia = con is None
+    motor = obtener_motor()
+    if propia:
+        con = motor.conectar(DB_PATH)
+    try:
+        huellas = leer_huellas_carga(con, motor)
+        huellas = huellas[~huellas["tabla"].isin([TABLAS_RAW[nombre] for nombre in datos])]
+        partes = [huellas] + [huellas_por_mes(nombre, df) for nombre, df in datos.items()]
+        partes = [h for h in partes if not h.empty]
+        if partes:
+            huellas = pd.concat(partes, ignore_index=True)
+        motor.escribir_tabla(con, TABLA_HUELLAS, huellas.astype({"filas": "int64", "huella": str}))
+    finally:
+        if propia:
+            con.close()
+
+
+def cargar_datos(datos: dict[str, pd.DataFrame], con=None) -> None:
+    """
+    - Carga los DataFrames validados en la BD (motor MOTOR_BD) como tablas de información cruda
+    - Registra las huellas por mes de cada tabla cargada ('huellas_carga')
+    - Si se pasa una conexión abierta se reutiliza y queda abierta (modo watch)
+    """
+    propia = con is None
+    motor = obtener_motor()
     try:
-        con = sqlite3.connect(DB_PATH)
+        if propia:
+            con = motor.conectar(DB_PATH)
         for nombre, df in datos.items():
-            tabla = tabla_map[nombre]
-            df.to_sql(tabla, con, if_exists="replace", index=False)
+            tabla = TABLAS_RAW[nombre]
+            motor.escribir_tabla(con, tabla, df)
             logger.info("Tabla '%s' cargada: %d filas.", tabla, len(df))
-    except sqlite3.Error as e:
+        registrar_huellas(datos, con)
+    except motor.errores as e:
         logger.error("Error de base de datos: %s", e)
         raise
     finally:
-        if con:
+        if propia and con:
             con.close()
-            logger.info("Base de datos guardada en: '%s", DB_PATH)
+            logger.info("Base de datos guardada en: '%s", motor.ruta(DB_PATH))
+
+
+def _pais(serie: pd.Series) -> pd.Series:
+    return serie.astype("string").str.strip().str.upper()
+
+
+def asignar_particiones(datos: dict[str, pd.DataFrame], clave: str) -> dict[str, pd.Series | None]:
+    """
+    - Valor de partición de cada fila, por tabla (None = tabla de referencia que se replica)
+    - pais: columna 'country'; pagos toman el país de su transacción y suscripciones el de su cliente
+    """
+    asignacion: dict[str, pd.Series | None] = {}
+    if clave == "pais":
+        pais_transaccion = pais_cliente = None
+        if "transacciones" in datos:
+            df = datos["transacciones"]
+            pais_transaccion = _pais(df["country"]).set_axis(df["transaction_id"].astype(str))
+        if "clientes" in datos:
+            df = datos["clientes"]
+            pais_cliente = _pais(df["country"]).set_axis(df["customer_id"].astype(str))
+
+        for nombre, df in datos.items():
+            if "country" in df.columns:
+                asignacion[nombre] = _pais(df["country"])
+            elif nombre == "pagos" and pais_transaccion is not None:
+                asignacion[nombre] = df["transaction_id"].astype(str).map(
+                    pais_transaccion[~pais_transaccion.index.duplicated()]
+                )
+            elif nombre == "suscripciones" and pais_cliente is not None:
+                asignacion[nombre] = df["customer_id"].astype(str).map(
+                    pais_cliente[~pais_cliente.index.duplicated()]
+                )
+            else:
+                asignacion[nombre] = None
+    else:
+        raise ValueError(f"Clave de partición no soportada: {clave}")
+    return asignacion
+
+
+def dividir_en_particiones(
+    datos: dict[str, pd.DataFrame], clave: str
+) -> dict[str, dict[str, pd.DataFrame]]:
+    """
+    - Divide las tablas validadas en {valor de partición: {tabla raw_*: DataFrame}}
+    - Todos los shards tienen todas las tablas (vacías si no hay filas para su valor), para que
+      'dbt build' encuentre siempre sus fuentes
+    """
+    asignacion = asignar_particiones(datos, clave)
+    grupos: dict[str, dict[str, pd.DataFrame]] = {}
+    for nombre, valores in asignacion.items():
+        if valores is None:
+            continue
+        valores = valores.fillna(VALOR_SIN_PARTICION).to_numpy()
+        grupos[nombre] = {
+            str(valor): df for valor, df in datos[nombre].groupby(valores, sort=True)
+        }
+
+    todos = sorted({valor for por_valor in grupos.values() for valor in por_valor})
+    particiones: dict[str, dict[str, pd.DataFrame]] = {
+        valor: {
+            TABLAS_RAW[nombre]: por_valor.get(valor, datos[nombre].iloc[:0])
+            for nombre, por_valor in grupos.items()
+        }
+        for valor in todos
+    }
+    if VALOR_SIN_PARTICION in particiones:
+        logger.warning(
+            "Filas sin valor de partición '%s' → shard %s (no se transforma): %s",
+            clave, VALOR_SIN_PARTICION,
+            {t: len(df) for t, df in particiones[VALOR_SIN_PARTICION].items() if len(df)},
+        )
+
+    # Las tablas de referencia (sin valor de partición) se replican en todos los shards
+    for nombre, valores in asignacion.items():
+        if valores is None:
+            for tablas in particiones.values():
+                tablas[TABLAS_RAW[nombre]] = datos[nombre]
+    return particiones
+
+
+def cargar_datos_particionados(datos: dict[str, pd.DataFrame], clave: str) -> list[str]:
+    """Carga las tablas raw_* en un shard SQLite por país (solo los que cambiaron)"""
+    reescritas = escribir_particiones(dividir_en_particiones(datos, clave), clave)
+    logger.info("Particiones reescritas (%s): %s", clave, reescritas or "ninguna")
+    return reescritas
 
 
 def ejecutar_pipeline() -> None: # pragma: no cover
     """Ejecución de todo el flujo de extracción"""
     dict_datos = extraer_datos()
+    tasas = extraer_tasas_cambio()
+    if tasas is not None:
+        dict_datos["tasas_cambio"] = tasas
     dict_datos = validar_datos(dict_datos)
-    cargar_datos(dict_datos)
+    dict_datos = normalizar_monedas(dict_datos, dict_datos.get("tasas_cambio"))
+    if PARTICIONADO not in ("", "pais"):
+        raise ValueError(f"PARTICIONADO no soportado: {PARTICIONADO} (usa 'pais')")
+    if PARTICIONADO == "pais":
+        cargar_datos_particionados(dict_datos, PARTICIONADO)
+        # Sin tablas raw_* en la BD consolidada, pero el estado de forecast sí vive en ella
+        registrar_huellas(dict_datos)
+    else:
+        cargar_datos(dict_datos)
@@ -0,0 +1,329 @@
+"""
+Renderizado del reporte financiero en texto, Markdown, JSON y CSV.
+
+Implementación:
+- Cada sección es una tabla (DataFrame con los valores tipados) más su bloque de texto
+- El formateo es por columna (una llamada por Series, sin iterrows); los montos y z-scores se
+  formatean elemento a elemento con 'Series.map(str.format)', el resto con métodos '.str'/'.dt'
+- Una sola pasada por las secciones produce Markdown, JSON y CSV (formato largo) a partir de las
+  tablas completas; el texto enviado a la IA es un recorte de esas secciones (top-N + 'OTROS',
+  secciones omitidas) según el presupuesto de tokens, así que ambos no coinciden necesariamente
+"""
+
+import json
+from functools import reduce
+from pathlib import Path
+import pandas as pd
+
+
+
+
+TITULO_REPORTE = "ANÁLISIS FINANCIERO – INNOVA FINANCE"
+TITULO_CONCLUSIONES = "CONCLUSIONES IA"
+TIPOS_NUMERICOS = ("usd", "entero", "pct", "z")
+
+# Columnas de cada tabla: {columna: (etiqueta, tipo de formato)}
+COLUMNAS_CATEGORIAS = {
+    "category":         ("Categoría", "texto"),
+    "total":            ("Total USD", "usd"),
+    "pct":              ("%", "pct"),
+    "transacciones":    ("Transacciones", "entero"),
+}
+COLUMNAS_PLANES = {
+    "plan":             ("Plan", "texto"),
+    "mrr_total":        ("MRR USD", "usd"),
+    "pct":              ("%", "pct"),
+    "suscripciones":    ("Suscripciones", "entero"),
+}
+COLUMNAS_TENDENCIAS = {
+    "serie":            ("Serie", "texto"),
+    "n_periodos":       ("Meses", "entero"),
+    "media_mensual":    ("Media mensual USD", "usd"),
+    "max_mensual":      ("Máximo USD", "usd"),
+    "min_mensual":      ("Mínimo USD", "usd"),
+    "cambio_total_pct": ("Cambio total", "pct"),
+    "volatilidad_pct":  ("Volatilidad", "pct"),
+}
+COLUMNAS_FORECAST = {
+    "periodo":           ("Período", "mes"),
+    "ingresos_forecast": ("Ingresos USD", "usd"),
+    "mrr_forecast":      ("MRR USD", "usd"),
+    "gastos_forecast":   ("Gastos USD", "usd"),
+    "margen_usd":        ("Margen USD", "usd"),
+    "margen_pct":        ("Margen", "pct"),
+}
+COLUMNAS_ANOMALIAS = {
+    "origen":       ("Origen", "texto"),
+    "date_key":     ("Fecha", "fecha"),
+    "country":      ("País", "texto"),
+    "category":     ("Categoría", "texto"),
+    "registro_key": ("Registro", "texto"),
+    "monto_usd":    ("Monto USD", "usd"),
+    "mediana_usd":  ("Mediana USD", "usd"),
+    "mad_usd":      ("MAD USD", "usd"),
+    "z_robusta":    ("z robusto", "z"),
+}
+
+
+
+
+def _usd(serie: pd.Series) -> pd.Series:
+    """Montos con separador de miles y 2 decimales (str.format por elemento)"""
+    return serie.map("{:,.2f}".format)
+
+
+def _entero(serie: pd.Series) -> pd.Series:
+    return pd.to_numeric(serie).fillna(0).astype("int64").astype(str)
+
+
+def _fecha_desde_key(serie: pd.Series) -> pd.Series:
+    """date_key YYYYMMDD → 'YYYY-MM-DD'"""
+    texto = _entero(serie)
+    return texto.str[:4] + "-" + texto.str[4:6] + "-" + texto.str[6:]
+
+
+def _unir(*partes: pd.Series | str) -> list[str]:
+    """Concatena columnas ya formateadas (y separadores) en una línea por fila"""
+    return reduce(lambda a, b: a + b, partes).tolist()
+
+
+def formatear_columna(serie: pd.Series, tipo: str) -> pd.Series:
+    """Formatea una columna completa según su tipo; los nulos quedan como cadena vacía"""
+    if tipo == "usd":
+        texto = _usd(serie)
+    elif tipo == "entero":
+        texto = _entero(serie)
+    elif tipo == "pct":
+        texto = serie.astype(str) + "%"
+    elif tipo == "z":
+        texto = serie.map("{:+.1f}".format)
+    elif tipo == "mes":
+        texto = pd.to_datetime(serie).dt.strftime("%Y-%m")
+    elif tipo == "fecha":
+        texto = _fecha_desde_key(serie)
+    else:
+        texto = serie.astype(str)
+    return texto.where(serie.notna(), "")
+
+
+def top_n_con_otros(
+    df: pd.DataFrame, col_etiqueta: str, columnas_suma: list[str], top_n: int
+) -> pd.DataFrame:
+    """
+    - Conserva las primeras top-N filas (el DataFrame ya viene ordenado de mayor a menor)
+    - Agrupa la cola larga en una única fila 'OTROS (k)' con sus totales y su %
+    """
+    if len(df) <= top_n:
+        return df
+    resto = df.iloc[top_n:]
+    otros = resto[columnas_suma + ["pct"]].sum().round(2).to_frame().T
+    otros[col_etiqueta] = f"OTROS ({len(resto)})"
+    return pd.concat([df.iloc[:top_n], otros[df.columns]], ignore_index=True).astype(df.dtypes)
+
+
+
+
+def seccion_categorias(resumen_cat: pd.DataFrame, top_n: int) -> dict:
+    """Gasto por categoría (top-N + 'OTROS')"""
+    df = top_n_con_otros(resumen_cat, "category", ["total", "transacciones"], top_n)
+    titulo = "CLASIFICACIÓN DE GASTOS POR CATEGORÍA"
+    filas = _unir(
+        "  • ", df["category"].astype(str).str.ljust(22),
+        " USD ", _usd(df["total"]).str.rjust(12),
+        "  (", df["pct"].astype(str), "%)  [",
+        _entero(df["transacciones"]), " transacciones]",
+    )
+    return {
+        "nombre": "categorias", "titulo": titulo, "clave": "category",
+        "tabla": df, "columnas": COLUMNAS_CATEGORIAS,
+        "lineas": ["", f"── {titulo} ──"] + filas,
+    }
+
+
+def seccion_planes(resumen_mrr: pd.DataFrame, top_n: int) -> dict:
+    """MRR activo por plan (top-N + 'OTROS')"""
+    df = top_n_con_otros(resumen_mrr, "plan", ["mrr_total", "suscripciones"], top_n)
+    titulo = "MRR ACTIVO POR PLAN"
+    filas = _unir(
+        "  • ", df["plan"].astype(str).str.ljust(22),
+        " USD ", _usd(df["mrr_total"]).str.rjust(12),
+        "  (", df["pct"].astype(str), "%)  [",
+        _entero(df["suscripciones"]), " suscripciones]",
+    )
+    return {
+        "nombre": "planes", "titulo": titulo, "clave": "plan",
+        "tabla": df, "columnas": COLUMNAS_PLANES,
+        "lineas": ["", f"── {titulo} ──"] + filas,
+    }
+
+
+def seccion_tendencias(tendencias: dict[str, dict], compacto: bool = False) -> dict:
+    """Tendencias históricas por serie: un bloque por serie o una línea por serie si 'compacto'"""
+    tendencias = {label: t for label, t in tendencias.items() if t}
+    tabla = pd.DataFrame(
+        [{"serie": label, **t} for label, t in tendencias.items()],
+        columns=list(COLUMNAS_TENDENCIAS),
+    )
+    if compacto:
+        lineas = ["", "── TENDENCIAS HISTÓRICAS (resumen) ──"] + [
+            f"  • {label}: media USD {t.get('media_mensual'):,.2f}, "
+            f"cambio {t.get('cambio_total_pct')}%, volatilidad {t.get('volatilidad_pct')}%"
+            for label, t in tendencias.items()
+        ]
+    else:
+        lineas = []
+        for label, t in tendencias.items():
+            lineas += [
+                "",
+                f"── TENDENCIA HISTÓRICA – {label} ──",
+                f"  Períodos analizados      : {t.get('n_periodos')} meses",
+                f"  Media mensual            : USD {t.get('media_mensual'):,.2f}",
+                f"  Máximo mensual           : USD {t.get('max_mensual'):,.2f}",
+                f"  Mínimo mensual           : USD {t.get('min_mensual'):,.2f}",
+                f"  Cambio total (inicio→fin): {t.get('cambio_total_pct')}%",
+                f"  Volatilidad mensual      : {t.get('volatilidad_pct')}%",
+            ]
+    return {
+        "nombre": "tendencias", "titulo": "TENDENCIAS HISTÓRICAS", "clave": "serie",
+        "tabla": tabla, "columnas": COLUMNAS_TENDENCIAS, "lineas": lineas,
+    }
+
+
+def seccion_forecast(margen_proyectado: pd.DataFrame) -> dict:
+    """Forecast consolidado de ingresos, MRR, gastos y margen"""
+    df = margen_proyectado
+    titulo = "FORECAST PRÓXIMOS 3 MESES"
+    lineas = []
+    if not df.empty:
+        lineas = [
+            "",
+            f"── {titulo} ──",
+            f"  {'Período':<10}  {'Ingresos':>14}  {'MRR':>14}  "
+            f"{'Gastos':>14}  {'Margen USD':>14}  {'Margen %':>9}",
+            "  " + "─" * 80,
+        ] + _unir(
+            "  ", pd.to_datetime(df["periodo"]).dt.strftime("%Y-%m").str.ljust(10),
+            "  USD ", _usd(df["ingresos_forecast"]).str.rjust(10),
+            "  USD ", _usd(df["mrr_forecast"]).str.rjust(10),
+            "  USD ", _usd(df["gastos_forecast"]).str.rjust(10),
+            "  USD ", _usd(df["margen_usd"]).str.rjust(10),
+            "  ", df["margen_pct"].map("{:.1f}".format).str.rjust(8), "%",
+        )
+    return {
+        "nombre": "forecast", "titulo": titulo, "clave": "periodo",
+        "tabla": df, "columnas": COLUMNAS_FORECAST, "lineas": lineas,
+    }
+
+
+def seccion_anomalias(anomalias: pd.DataFrame, top_n: int) -> dict:
+    """Top-N anomalías por |z| (la tabla ya viene ordenada)"""
+    titulo = f"ANOMALÍAS DETECTADAS (top {min(top_n, len(anomalias))} de {len(anomalias)})"
+    df = anomalias.head(top_n)
+    pais = df["country"].astype(str)
+    segmento = pais.where(df["category"].isna(), pais + " / " + df["category"].astype(str))
+    filas = _unir(
+        "  • ", df["origen"].astype(str).str.ljust(13),
+        " ", _fecha_desde_key(df["date_key"]),
+        "  ", segmento.str.ljust(30),
+        " USD ", _usd(df["monto_usd"]).str.rjust(12),
+        "  (mediana USD ", _usd(df["mediana_usd"]),
+        ", z=", df["z_robusta"].map("{:+.1f}".format), ")",
+    )
+    return {
+        "nombre": "anomalias", "titulo": titulo, "clave": "registro_key",
+        "tabla": df, "columnas": COLUMNAS_ANOMALIAS,
+        "lineas": ["", f"── {titulo} ──"] + filas,
+    }
+
+
+
+
+def _tabla_markdown(seccion: dict) -> list[str]:
+    """Tabla Markdown de una sección (una columna formateada a la vez)"""
+    tabla = seccion["tabla"]
+    columnas = {c: v for c, v in seccion["columnas"].items() if c in tabla.columns}
+    encabezado = "| " + " | ".join(etiqueta for etiqueta, _ in columnas.values()) + " |"
+    alineacion = "|" + "|".join(
+        "---:" if tipo in TIPOS_NUMERICOS else "---" for _, tipo in columnas.values()
+    ) + "|"
+    if tabla.empty:
+        return [encabezado, alineacion]
+    celdas = [
+        formatear_columna(tabla[col], tipo).str.replace("|", r"\|", regex=False)
+        for col, (_, tipo) in columnas.items()
+    ]
+    filas = reduce(lambda a, b: a + " | " + b, celdas)
+    return [encabezado, alineacion] + ("| " + filas + " |").tolist()
+
+
+def _registros(seccion: dict) -> list[dict]:
+    """Filas de la sección con valores tipados (fechas ISO, nulos → null)"""
+    tabla = seccion["tabla"].copy()
+    for col in tabla.select_dtypes(include="datetime").columns:
+        tabla[col] = tabla[col].dt.strftime("%Y-%m-%d")
+    return json.loads(tabla.to_json(orient="records", force_ascii=False))
+
+
+def _formato_largo(seccion: dict) -> pd.DataFrame:
+    """Sección en formato largo: (seccion, segmento, metrica, valor)"""
+    tabla = seccion["tabla"]
+    clave = seccion["clave"]
+    segmento = tabla[clave]
+    if pd.api.types.is_datetime64_any_dtype(segmento):
+        segmento = segmento.dt.strftime("%Y-%m-%d")
+    largo = (
+        tabla.drop(columns=clave)
+        .astype(object)
+        .assign(segmento=segmento.to_numpy())
+        .melt(id_vars="segmento", var_name="metrica", value_name="valor")
+    )
+    largo.insert(0, "seccion", seccion["nombre"])
+    return largo
+
+
+def renderizar(
+    metadatos: dict, secciones: list[dict], conclusiones: str = ""
+) -> dict[str, str]:
+    """
+    - Renderiza en una sola pasada las secciones a Markdown, JSON y CSV desde su 'tabla' tipada
+      (no usa el bloque de texto); se espera recibir las secciones completas, sin el recorte por
+      presupuesto de tokens ni top-N que se aplica al texto enviado a la IA
+    - 'metadatos' son los datos del encabezado (fecha y conteos de registros)
+    - Retorna {formato: contenido} con las claves 'md', 'json' y 'csv'
+    """
+    markdown = [f"# {TITULO_REPORTE}", ""]
+    markdown += [f"- **{clave}**: {valor}" for clave, valor in metadatos.items()]
+    documento = {"titulo": TITULO_REPORTE, **metadatos, "secciones": {}}
+    largos = []
+
+    for seccion in secciones:
+        markdown += ["", f"## {seccion['titulo']}", ""] + _tabla_markdown(seccion)
+        documento["secciones"][seccion["nombre"]] = {
+            "titulo": seccion["titulo"],
+            "filas": _registros(seccion),
+        }
+        largos.append(_formato_largo(seccion))
+
+    if conclusiones:
+        markdown += ["", f"## {TITULO_CONCLUSIONES}", "", conclusiones.strip()]
+        documento["conclusiones_ia"] = conclusiones
+    csv = (
+        pd.concat(largos, ignore_index=True)
+        if largos else pd.DataFrame(columns=["seccion", "segmento", "metrica", "valor"])
+    )
+    return {
+        "md": "\n".join(markdown) + "\n",
+        "json": json.dumps(documento, ensure_ascii=False, indent=2),
+        "csv": csv.to_csv(index=False),
+    }
+
+
+def guardar_formatos(salidas: dict[str, str], output_path: Path) -> list[Path]:
+    """Escribe cada formato junto al reporte de texto (mismo nombre, distinta extensión)"""
+    rutas = []
+    for formato, contenido in salidas.items():
+        ruta = Path(output_path).with_suffix(f".{formato}")
+        with open(ruta, "w", encoding="utf-8", newline="") as f:
+            f.write(contenido)
+        rutas.append(ruta)
+    return rutas
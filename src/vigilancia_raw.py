@@ -0,0 +1,305 @@
+"""
+Modo watch: procesamiento en micro-lotes de los archivos nuevos o modificados en data/raw.
+
+Implementación:
+- Sondeo (polling) periódico de data/raw por huella de archivo (mtime, tamaño), sin dependencias
+- Debounce: un lote se procesa cuando los archivos dejan de cambiar durante WATCH_DEBOUNCE_S
+- Solo las tablas cambiadas pasan por validación → carga → 'dbt build' de sus modelos dependientes
+- Estado caliente entre lotes: módulos importados, conexión a la BD, tasas de cambio y el manifest
+  de dbt ya parseado (dbtRunner en proceso; si dbt no es importable se usa el CLI)
+- Con MOTOR_BD=duckdb la conexión se libera durante el 'dbt build', que necesita el archivo
+- Cada lote registra sus latencias (de la llegada del archivo al fin del dbt) en logs/metricas_watch.jsonl
+- Un lote fallido se reintenta con espera exponencial hasta WATCH_MAX_REINTENTOS intentos; luego se
+  abandona hasta que sus archivos vuelvan a cambiar
+"""
+
+import os
+import json
+import time
+import logging
+import subprocess
+from contextlib import chdir, contextmanager
+from datetime import datetime
+from pathlib import Path
+from collections.abc import Callable
+import pandas as pd
+
+from src import pipeline_extraccion as extraccion
+from src.motor_bd import obtener_motor
+
+
+
+
+logger = logging.getLogger("vigilancia_raw")
+
+INTERVALO_S = float(os.getenv("WATCH_INTERVALO_S", "2"))
+DEBOUNCE_S = float(os.getenv("WATCH_DEBOUNCE_S", "5"))
+MAX_REINTENTOS = int(os.getenv("WATCH_MAX_REINTENTOS", "5"))
+BACKOFF_MAX_S = float(os.getenv("WATCH_BACKOFF_MAX_S", "300"))
+ARCHIVO_METRICAS = Path("logs/metricas_watch.jsonl")
+DIR_DBT = Path("dbt_env")
+
+
+
+
+def archivos_vigilados() -> dict[str, str]:
+    """{archivo CSV: nombre de tabla} de los archivos que alimentan el pipeline"""
+    archivos = {archivo: nombre for nombre, archivo in extraccion.ARCHIVOS_RAW.items()}
+    archivos[extraccion.ARCHIVO_TASAS] = "tasas_cambio"
+    return archivos
+
+
+def huellas_archivos() -> dict[str, tuple[int, int]]:
+    """Huella (mtime_ns, tamaño) de cada tabla cuyo archivo existe en RAW_DIR"""
+    huellas = {}
+    for archivo, nombre in archivos_vigilados().items():
+        try:
+            info = (extraccion.RAW_DIR / archivo).stat()
+        except FileNotFoundError:
+            continue
+        huellas[nombre] = (info.st_mtime_ns, info.st_size)
+    return huellas
+
+
+def tablas_cambiadas(
+    previas: dict[str, tuple[int, int]], actuales: dict[str, tuple[int, int]]
+) -> set[str]:
+    """Tablas cuyo archivo es nuevo o cambió (los archivos eliminados se ignoran)"""
+    return {nombre for nombre, huella in actuales.items() if previas.get(nombre) != huella}
+
+
+def expandir_dependencias(nombres: set[str]) -> set[str]:
+    """Si cambian las tasas de cambio, las tablas con montos en moneda local se reconvierten"""
+    if "tasas_cambio" in nombres:
+        return nombres | {n for n in extraccion.COLUMNAS_FX if n in extraccion.ARCHIVOS_RAW}
+    return set(nombres)
+
+
+def espera_reintento(intentos_fallidos: int, debounce_s: float) -> float:
+    """Espera antes de reintentar un lote: debounce, 2×debounce, 4×debounce, ... hasta BACKOFF_MAX_S"""
+    return min(debounce_s * 2 ** (intentos_fallidos - 1), BACKOFF_MAX_S)
+
+
+def selectores_dbt(nombres: set[str]) -> list[str]:
+    """Selectores 'source:raw.<tabla>+' (la fuente y todos sus modelos dependientes)"""
+    return [
+        f"source:raw.{extraccion.TABLAS_RAW[nombre]}+"
+        for nombre in sorted(nombres)
+        if nombre in extraccion.ARCHIVOS_RAW
+    ]
+
+
+
+
+class EjecutorDbt:
+    """'dbt build' selectivo reutilizando el manifest parseado entre lotes"""
+
+    def __init__(self, directorio: Path = DIR_DBT):
+        self.directorio = Path(directorio)
+        self._runner = None
+
+    def preparar(self) -> None:
+        """Parsea el proyecto una sola vez; sin dbt importable se usará el CLI en cada lote"""
+        try:
+            from dbt.cli.main import dbtRunner  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            logger.warning("dbt no es importable en este entorno: se usará el CLI 'dbt' por lote")
+            return
+        with chdir(self.directorio):
+            resultado = dbtRunner().invoke(["parse"])
+        if not resultado.success:
+            raise RuntimeError(f"Falló 'dbt parse': {resultado.exception}")
+        self._runner = dbtRunner(manifest=resultado.result)
+        logger.info("Manifest de dbt parseado y en memoria.")
+
+    def build(self, selectores: list[str]) -> bool:
+        """Ejecuta 'dbt build --select ...'; retorna True si terminó sin errores"""
+        if not selectores:
+            return True
+        comando = ["build", "--select", *selectores]
+        logger.info("Ejecutando: dbt %s", " ".join(comando))
+        if self._runner is not None:
+            with chdir(self.directorio):
+                return bool(self._runner.invoke(comando).success)
+        resultado = subprocess.run(["dbt", *comando], cwd=self.directorio, check=False)
+        return resultado.returncode == 0
+
+
+
+
+class VigilanteRaw:
+    """Bucle de vigilancia de data/raw con estado caliente entre micro-lotes"""
+
+    def __init__(self, ejecutor_dbt: EjecutorDbt | None = None):
+        if extraccion.PARTICIONADO:
+            raise ValueError(
+                "El modo watch carga sobre la BD consolidada; no está disponible con PARTICIONADO"
+            )
+        self.motor = obtener_motor()
+        self.con = None
+        self.tasas: pd.DataFrame | None = None
+        self.huellas: dict[str, tuple[int, int]] = {}
+        self.ejecutor_dbt = ejecutor_dbt or EjecutorDbt()
+        self.lotes = 0
+
+    def iniciar(self) -> None:
+        """
+        - Abre la conexión, carga las tasas de cambio vigentes y parsea el proyecto dbt
+        - Los archivos presentes al iniciar se consideran ya procesados (p. ej. por '--step all')
+        """
+        self.con = self.motor.conectar(extraccion.DB_PATH)
+        self.tasas = self._leer_tasas()
+        self.ejecutor_dbt.preparar()
+        self.huellas = huellas_archivos()
+        logger.info("Vigilando '%s' (%d archivos presentes).", extraccion.RAW_DIR, len(self.huellas))
+
+    def cerrar(self) -> None:
+        """Cierra la conexión a la BD"""
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+    @contextmanager
+    def _bd_liberada(self):
+        """
+        - DuckDB bloquea el archivo para un solo proceso: la conexión se cierra mientras corre
+          dbt (CLI o dbtRunner abren su propia conexión) y se reabre al terminar
+        - Con SQLite la conexión se mantiene abierta
+        """
+        if self.motor.nombre != "duckdb":
+            yield
+            return
+        self.cerrar()
+        try:
+            yield
+        finally:
+            self.con = self.motor.conectar(extraccion.DB_PATH)
+
+    def _leer_tasas(self) -> pd.DataFrame | None:
+        tasas = extraccion.extraer_tasas_cambio()
+        if tasas is None:
+            return None
+        return extraccion.validar_datos({"tasas_cambio": tasas})["tasas_cambio"]
+
+    def procesar_lote(self, nombres: set[str], llegada: float | None = None) -> dict:
+        """
+        - Valida, carga y transforma solo las tablas indicadas (más las que dependen de ellas)
+        - 'llegada' es el timestamp (epoch) del archivo más antiguo del lote, para la latencia total
+        - Retorna las métricas del lote y las agrega a ARCHIVO_METRICAS
+        """
+        inicio = time.time()
+        nombres = expandir_dependencias(nombres)
+        metricas = {
+            "lote": self.lotes + 1,
+            "inicio": datetime.fromtimestamp(inicio).isoformat(timespec="seconds"),
+            "tablas": sorted(nombres),
+            "ok": False,
+        }
+        try:
+            t = time.perf_counter()
+            datos = extraccion.extraer_datos(sorted(nombres & set(extraccion.ARCHIVOS_RAW)))
+            if "tasas_cambio" in nombres:
+                tasas = extraccion.extraer_tasas_cambio()
+                if tasas is not None:
+                    datos["tasas_cambio"] = tasas
+            metricas["lectura_s"] = round(time.perf_counter() - t, 3)
+
+            t = time.perf_counter()
+            datos = extraccion.validar_datos(datos)
+            if "tasas_cambio" in datos:
+                self.tasas = datos["tasas_cambio"]
+            datos = extraccion.normalizar_monedas(datos, self.tasas)
+            metricas["validacion_s"] = round(time.perf_counter() - t, 3)
+            metricas["filas"] = int(sum(len(df) for df in datos.values()))
+
+            t = time.perf_counter()
+            extraccion.cargar_datos(datos, con=self.con)
+            metricas["carga_s"] = round(time.perf_counter() - t, 3)
+
+            t = time.perf_counter()
+            with self._bd_liberada():
+                metricas["ok"] = self.ejecutor_dbt.build(selectores_dbt(nombres))
+            metricas["dbt_s"] = round(time.perf_counter() - t, 3)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("Falló el lote %d: %s", metricas["lote"], e)
+            metricas["error"] = str(e)
+
+        fin = time.time()
+        metricas["procesamiento_s"] = round(fin - inicio, 3)
+        if llegada is not None:
+            metricas["latencia_total_s"] = round(fin - llegada, 3)
+        self.lotes += 1
+        _registrar_metricas(metricas)
+        logger.info(
+            "Lote %d (%s): %s en %.2fs, latencia total %s s",
+            metricas["lote"], ", ".join(metricas["tablas"]),
+            "OK" if metricas["ok"] else "CON ERRORES",
+            metricas["procesamiento_s"], metricas.get("latencia_total_s", "—"),
+        )
+        return metricas
+
+    def ejecutar(
+        self,
+        intervalo_s: float = INTERVALO_S,
+        debounce_s: float = DEBOUNCE_S,
+        max_lotes: int | None = None,
+        esperar: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """
+        - Sondea RAW_DIR cada 'intervalo_s' y procesa un lote cuando los cambios llevan
+          'debounce_s' segundos estables
+        - Un lote fallido (carga o dbt) se reintenta con espera exponencial ('espera_reintento');
+          tras MAX_REINTENTOS intentos se abandona (error en el log) y sus archivos se marcan como
+          vistos, de modo que solo un nuevo cambio en ellos vuelve a procesarlos
+        - Termina tras 'max_lotes' lotes (None = indefinidamente, hasta Ctrl+C)
+        """
+        if self.con is None:
+            self.iniciar()
+        ultima_vista = self.huellas
+        ultimo_cambio = time.monotonic()
+        proximo_intento = 0.0
+        lote_fallido: dict[str, tuple[int, int]] | None = None
+        fallos = 0
+        try:
+            while max_lotes is None or self.lotes < max_lotes:
+                actuales = huellas_archivos()
+                if actuales != ultima_vista:
+                    ultima_vista, ultimo_cambio = actuales, time.monotonic()
+                    proximo_intento = 0.0
+
+                cambiadas = tablas_cambiadas(self.huellas, actuales)
+                ahora = time.monotonic()
+                if cambiadas and ahora - ultimo_cambio >= debounce_s and ahora >= proximo_intento:
+                    lote = {nombre: actuales[nombre] for nombre in cambiadas}
+                    if lote != lote_fallido:
+                        fallos = 0
+                    llegada = min(huella[0] for huella in lote.values()) / 1e9
+                    if self.procesar_lote(cambiadas, llegada)["ok"]:
+                        self.huellas, lote_fallido, fallos = actuales, None, 0
+                        continue
+
+                    # Las huellas no avanzan: el lote se reintenta con espera exponencial
+                    lote_fallido, fallos = lote, fallos + 1
+                    if fallos >= MAX_REINTENTOS:
+                        logger.error(
+                            "Lote de %s abandonado tras %d intentos fallidos; se reprocesará "
+                            "cuando cambien sus archivos", ", ".join(sorted(cambiadas)), fallos,
+                        )
+                        self.huellas, lote_fallido, fallos = actuales, None, 0
+                    else:
+                        proximo_intento = time.monotonic() + espera_reintento(fallos, debounce_s)
+                    continue
+                esperar(intervalo_s)
+        except KeyboardInterrupt:
+            logger.info("Modo watch detenido por el usuario.")
+        finally:
+            self.cerrar()
+
+
+
+
+def _registrar_metricas(metricas: dict) -> None:
+    """Agrega las métricas de un lote como una línea JSON"""
+    ARCHIVO_METRICAS.parent.mkdir(parents=True, exist_ok=True)
+    with open(ARCHIVO_METRICAS, "a", encoding="utf-8") as f:
+        f.write(json.dumps(metricas, ensure_ascii=False) + "\n")
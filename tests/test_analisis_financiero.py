@@ -0,0 +1,159 @@
+"""
+Tests para analisis_financiero.py
+Cubre: analizar_con_ia_streaming, guardar_reporte_streaming, construir_resumen, construir_reporte,
+       secciones_reporte
+"""
+
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.analisis_financiero import ( # pylint: disable=wrong-import-position
+    MENSAJE_IA_DESACTIVADA,
+    analizar_con_ia_streaming,
+    guardar_reporte_streaming,
+    construir_resumen,
+    construir_reporte,
+    estimar_tokens,
+    resumen_por_categoria,
+    resumen_mrr_por_plan,
+    secciones_reporte,
+)
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+@pytest.fixture
+def insumos_resumen() -> dict:
+    """Insumos de 'construir_resumen' con una cola larga de categorías"""
+    df_gastos = pd.DataFrame({
+        "category": [f"CATEGORIA_{i:03d}" for i in range(200)],
+        "gastos_usd": [float(1000 - i) for i in range(200)],
+    })
+    df_mrr = pd.DataFrame({
+        "plan": ["BASIC", "PRO", "ENTERPRISE"],
+        "mrr_usd": [100.0, 300.0, 900.0],
+        "total_suscripciones": [10, 5, 2],
+    })
+    tendencia = {
+        "media_mensual": 1000.0, "max_mensual": 1200.0, "min_mensual": 800.0,
+        "cambio_total_pct": 5.0, "volatilidad_pct": 2.1, "n_periodos": 12,
+    }
+    margen = pd.DataFrame({
+        "periodo": pd.date_range("2025-01-01", periods=3, freq="MS"),
+        "ingresos_forecast": [10.0, 11.0, 12.0],
+        "gastos_forecast": [5.0, 5.0, 5.0],
+        "mrr_forecast": [3.0, 3.0, 3.0],
+        "margen_usd": [5.0, 6.0, 7.0],
+        "margen_pct": [50.0, 54.5, 58.3],
+    })
+    return {
+        "df_gastos": df_gastos,
+        "df_ingresos": pd.DataFrame(),
+        "df_mrr": df_mrr,
+        "resumen_cat": resumen_por_categoria(df_gastos),
+        "resumen_mrr": resumen_mrr_por_plan(df_mrr),
+        "tendencia_gastos": tendencia,
+        "tendencia_ingresos": tendencia,
+        "tendencia_mrr": tendencia,
+        "margen_proyectado": margen,
+    }
+
+
+
+
+class TestStreamingIA:
+    """Clase para definir los tests del modo streaming del reporte IA"""
+
+    def test_resumen_disponible_antes_de_la_ia(self, tmp_path):
+        """El resumen debe estar escrito en el '.partial' antes del primer fragmento"""
+        output_path = tmp_path / "analisis_financiero_ia.txt"
+        parcial = tmp_path / "analisis_financiero_ia.txt.partial"
+        vistos = []
+
+        def fragmentos():
+            vistos.append(parcial.read_text(encoding="utf-8"))
+            yield "Hola "
+            vistos.append(parcial.read_text(encoding="utf-8"))
+            yield "mundo"
+
+        interpretacion = guardar_reporte_streaming("RESUMEN", fragmentos(), output_path)
+
+        assert interpretacion == "Hola mundo"
+        assert vistos[0].startswith("RESUMEN")
+        assert vistos[1].endswith("Hola ")
+        assert not parcial.exists()
+        assert output_path.read_text(encoding="utf-8").endswith("Hola mundo")
+
+
+    def test_sin_api_key_entrega_mensaje(self, monkeypatch):
+        """Sin ANTHROPIC_API_KEY debe entregar el aviso de IA desactivada"""
+        monkeypatch.setattr("src.analisis_financiero.ANTHROPIC_API_KEY", "")
+        assert list(analizar_con_ia_streaming("RESUMEN")) == [MENSAJE_IA_DESACTIVADA]
+
+
+
+
+class TestConstruirResumen:
+    """Clase para definir los tests del presupuesto de tokens de 'construir_resumen'"""
+
+    @pytest.mark.parametrize("presupuesto", [20, 150, 400, 1000, 5000])
+    def test_respeta_presupuesto(self, insumos_resumen, presupuesto): # pylint: disable=redefined-outer-name
+        """El resumen nunca debe superar el presupuesto de tokens estimado"""
+        texto = construir_resumen(**insumos_resumen, max_tokens=presupuesto)
+        assert estimar_tokens(texto) <= presupuesto
+
+
+    def test_agrupa_cola_larga_en_otros(self, insumos_resumen): # pylint: disable=redefined-outer-name
+        """Con top_n, las categorías restantes deben agruparse en una fila 'OTROS'"""
+        texto = construir_resumen(**insumos_resumen, max_tokens=5000, top_n=5)
+        assert "OTROS (195)" in texto
+        assert "CATEGORIA_005" not in texto
+
+
+    def test_prioriza_forecast(self, insumos_resumen): # pylint: disable=redefined-outer-name
+        """Con un presupuesto ajustado el forecast debe conservarse antes que las categorías"""
+        texto = construir_resumen(**insumos_resumen, max_tokens=250)
+        assert "FORECAST PRÓXIMOS 3 MESES" in texto
+        assert "CLASIFICACIÓN DE GASTOS" not in texto
+
+
+    def test_reporte_expone_secciones_del_texto(self, insumos_resumen): # pylint: disable=redefined-outer-name
+        """Las secciones retornadas deben ser exactamente las incluidas en el texto"""
+        reporte = construir_reporte(**insumos_resumen, max_tokens=250)
+        nombres = [seccion["nombre"] for seccion in reporte["secciones"]]
+        assert "forecast" in nombres and "categorias" not in nombres
+        for seccion in reporte["secciones"]:
+            assert "\n".join(seccion["lineas"]) in reporte["texto"]
+
+
+    def test_sin_anomalias_no_advierte_presupuesto(self, insumos_resumen, caplog): # pylint: disable=redefined-outer-name
+        """Una sección sin filas no debe reportarse como omitida por presupuesto"""
+        with caplog.at_level("WARNING", logger="analisis_financiero"):
+            reporte = construir_reporte(**insumos_resumen, anomalias=pd.DataFrame(), max_tokens=100000)
+        assert "omitida" not in caplog.text
+        assert "anomalias" not in [seccion["nombre"] for seccion in reporte["secciones"]]
+
+        with caplog.at_level("WARNING", logger="analisis_financiero"):
+            construir_reporte(**insumos_resumen, max_tokens=20)
+        assert "Sección 'categorias' omitida" in caplog.text
+
+
+    def test_formatos_estructurados_con_tablas_completas(self, insumos_resumen): # pylint: disable=redefined-outer-name
+        """El presupuesto del texto no debe recortar las secciones de Markdown, JSON y CSV"""
+        insumos = {
+            clave: valor for clave, valor in insumos_resumen.items()
+            if clave not in ("df_gastos", "df_ingresos", "df_mrr")
+        }
+        secciones = {s["nombre"]: s for s in secciones_reporte(**insumos)}
+        texto = construir_resumen(**insumos_resumen, max_tokens=250, top_n=5)
+
+        assert "CLASIFICACIÓN DE GASTOS" not in texto
+        assert list(secciones) == ["categorias", "planes", "tendencias", "forecast"]
+        assert len(secciones["categorias"]["tabla"]) == 200
+        assert not secciones["categorias"]["tabla"]["category"].str.startswith("OTROS").any()
+        assert len(secciones["tendencias"]["tabla"]) == 3
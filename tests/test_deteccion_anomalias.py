@@ -0,0 +1,125 @@
+"""
+Tests para deteccion_anomalias.py
+Cubre: zscore_robusto_movil, detectar_anomalias_df, detectar_anomalias
+"""
+
+import sys
+from pathlib import Path
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.deteccion_anomalias import ( # pylint: disable=wrong-import-position
+    detectar_anomalias,
+    detectar_anomalias_df,
+    zscore_robusto_movil,
+)
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+@pytest.fixture
+def fact_gastos() -> pd.DataFrame:
+    """Gastos de 2 países × 2 categorías con un valor atípico conocido"""
+    rng = np.random.default_rng(0)
+    filas = []
+    for pais in ("COLOMBIA", "MEXICO"):
+        for category in ("MARKETING", "NOMINA"):
+            for dia in range(1, 29):
+                filas.append({
+                    "expense_key": f"{pais}-{category}-{dia}",
+                    "date_key": 20240100 + dia,
+                    "country": pais,
+                    "category": category,
+                    "amount_usd": float(rng.normal(100, 5)),
+                })
+    df = pd.DataFrame(filas)
+    df.loc[df["expense_key"] == "MEXICO-NOMINA-20", "amount_usd"] = 1000.0
+    return df
+
+
+
+
+class TestZscoreRobustoMovil:
+    """Clase para definir los tests del z-score robusto móvil"""
+
+    def test_coincide_con_calculo_por_fila(self):
+        """Debe coincidir con una implementación ingenua fila a fila"""
+        rng = np.random.default_rng(1)
+        grupos = np.sort(rng.integers(0, 3, 300))
+        valores = rng.lognormal(3, 0.5, 300)
+        mediana, mad, _ = zscore_robusto_movil(valores, grupos, ventana=20, min_observaciones=5)
+
+        for i in range(300):
+            previos = valores[max(0, i - 20):i][grupos[max(0, i - 20):i] == grupos[i]]
+            if len(previos) < 5:
+                assert np.isnan(mediana[i])
+                continue
+            m = np.median(previos)
+            assert mediana[i] == pytest.approx(m)
+            assert mad[i] == pytest.approx(np.median(np.abs(previos - m)))
+
+
+    def test_ventana_constante_con_pico(self):
+        """Con MAD = 0 (montos repetidos) un pico debe marcarse y los valores iguales no"""
+        valores = np.full(30, 1500.0)
+        valores[25] = 150000.0
+        _, mad, z = zscore_robusto_movil(valores, np.zeros(30, dtype=int), 10, 5)
+        assert mad[25] == 0
+        assert z[25] > 100
+        assert (z[5:25] == 0).all()
+
+
+    def test_mad_cero_usa_mean_ad(self):
+        """Si el MAD es 0 pero la ventana no es constante, la escala es 1.2533·MeanAD"""
+        valores = np.array([100.0] * 8 + [110.0, 90.0, 200.0])
+        _, mad, z = zscore_robusto_movil(valores, np.zeros(11, dtype=int), 10, 5)
+        assert mad[10] == 0
+        assert z[10] == pytest.approx(100.0 / (1.2533 * 2.0))
+
+
+    def test_ventana_de_ceros_sin_zscore(self):
+        """Con una ventana constante en 0 no hay escala y el z-score queda indefinido"""
+        _, _, z = zscore_robusto_movil(np.zeros(30), np.zeros(30, dtype=int), 10, 5)
+        assert np.isnan(z).all()
+
+
+
+
+class TestDetectarAnomalias:
+    """Clase para definir los tests de detección sobre tablas de hechos"""
+
+    def test_marca_valor_atipico(self, fact_gastos): # pylint: disable=redefined-outer-name
+        """Solo el valor atípico debe marcarse, con su grupo país × categoría"""
+        resultado = detectar_anomalias_df(
+            fact_gastos, "gastos", "expense_key", "amount_usd", ["country", "category"],
+        )
+        assert resultado["registro_key"].tolist() == ["MEXICO-NOMINA-20"]
+        assert resultado.iloc[0]["category"] == "NOMINA"
+        assert resultado.iloc[0]["z_robusta"] > 3.5
+
+
+    def test_guarda_tabla_anomalias(self, fact_gastos, tmp_path): # pylint: disable=redefined-outer-name
+        """Debe escribir la tabla 'anomalias' con las marcadas de todos los hechos"""
+        con = sqlite3.connect(tmp_path / "test.db")
+        fact_gastos.to_sql("fact_gastos", con, index=False)
+        pd.DataFrame(columns=["transaction_key", "date_key", "country", "total_usd"]).to_sql(
+            "fact_transacciones", con, index=False
+        )
+        resultado = detectar_anomalias(con)
+        guardadas = pd.read_sql("SELECT * FROM anomalias", con)
+        con.close()
+        assert len(resultado) == len(guardadas) == 1
+
+
+    def test_falla_si_falta_tabla_de_hechos(self, fact_gastos, tmp_path): # pylint: disable=redefined-outer-name
+        """Un hecho inexistente debe fallar en lugar de dejar la sección vacía en silencio"""
+        con = sqlite3.connect(tmp_path / "test.db")
+        fact_gastos.to_sql("fact_gastos", con, index=False)
+        with pytest.raises(RuntimeError, match="fact_transacciones"):
+            detectar_anomalias(con)
+        con.close()
@@ -0,0 +1,180 @@
+"""
+Tests para estado_forecast.py
+Cubre: actualizar_estado, sincronizar_estado, huellas de la historia, tendencia/forecast desde estado,
+       persistencia, actualizar_estado_forecast
+"""
+
+import sys
+from pathlib import Path
+import sqlite3
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.estado_forecast import ( # pylint: disable=wrong-import-position
+    actualizar_estado,
+    cargar_estados,
+    construir_estado,
+    diferencias_estado,
+    forecast_desde_estado,
+    estado_vigente,
+    guardar_estados,
+    huella_historia,
+    sincronizar_estado,
+    tendencia_desde_estado,
+)
+from src.analisis_financiero import ( # pylint: disable=wrong-import-position
+    actualizar_estado_forecast,
+    calcular_tendencia,
+    forecast_lineal,
+)
+from src import analisis_financiero # pylint: disable=wrong-import-position
+from src.pipeline_extraccion import registrar_huellas # pylint: disable=wrong-import-position
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+@pytest.fixture
+def serie() -> pd.Series:
+    """Serie mensual de 8 meses"""
+    return pd.Series(
+        [100.0, 120.0, 90.0, 150.0, 160.0, 155.0, 170.0, 180.0],
+        index=pd.date_range("2024-01-01", periods=8, freq="MS"),
+    )
+
+
+
+
+class TestEquivalencia:
+    """Clase para definir los tests de equivalencia con el cálculo completo"""
+
+    def test_tendencia(self, serie): # pylint: disable=redefined-outer-name
+        """Debe coincidir con 'calcular_tendencia'"""
+        assert tendencia_desde_estado(construir_estado(serie, "s")) == calcular_tendencia(serie)
+
+
+    def test_forecast(self, serie): # pylint: disable=redefined-outer-name
+        """Debe coincidir con 'forecast_lineal'"""
+        pd.testing.assert_frame_equal(
+            forecast_desde_estado(construir_estado(serie, "s")),
+            forecast_lineal(serie),
+        )
+
+
+    def test_incremental_igual_a_reconstruccion(self, serie): # pylint: disable=redefined-outer-name
+        """Sincronizar mes a mes debe dar el mismo estado que construir desde cero"""
+        estado = construir_estado(serie.iloc[:5], "s")
+        estado = sincronizar_estado(estado, serie, "s")
+        assert not diferencias_estado(construir_estado(serie, "s"), estado)
+
+
+
+
+class TestActualizacion:
+    """Clase para definir los tests de actualización del estado"""
+
+    def test_rechaza_periodo_anterior(self, serie): # pylint: disable=redefined-outer-name
+        """Un mes igual o anterior al último registrado debe rechazarse"""
+        estado = construir_estado(serie, "s")
+        with pytest.raises(ValueError, match="reconstruye"):
+            actualizar_estado(estado, serie.index[-1], 1.0)
+
+
+    def test_sincroniza_solo_con_meses_nuevos(self, serie): # pylint: disable=redefined-outer-name
+        """Basta con pasar los meses posteriores al último registrado"""
+        estado = sincronizar_estado(construir_estado(serie.iloc[:5], "s"), serie.iloc[5:], "s")
+        assert not diferencias_estado(construir_estado(serie, "s"), estado)
+
+
+    def test_huella_detecta_correcciones_de_meses_registrados(self):
+        """Solo una corrección de un mes ya incorporado debe invalidar el estado"""
+        huellas = pd.DataFrame({
+            "tabla": ["raw_gastos"] * 3,
+            "periodo": ["2024-01", "2024-02", "2024-03"],
+            "filas": [2, 2, 2],
+            "huella": ["1", "2", "3"],
+        })
+        hasta = pd.Timestamp("2024-02-01")
+        estado = {"n": 2, "huella_historia": huella_historia(huellas, ["raw_gastos"], hasta)}
+
+        mes_nuevo = huellas.assign(huella=["1", "2", "999"])
+        corregida = huellas.assign(huella=["111", "2", "3"])
+        assert estado_vigente(estado, huella_historia(mes_nuevo, ["raw_gastos"], hasta))
+        assert not estado_vigente(estado, huella_historia(corregida, ["raw_gastos"], hasta))
+        assert not estado_vigente(estado, huella_historia(huellas, ["raw_gastos"], hasta, "paises=MEXICO"))
+        assert huella_historia(huellas, ["raw_pagos"], hasta) is None
+
+
+    def test_persistencia(self, serie, tmp_path): # pylint: disable=redefined-outer-name
+        """El estado guardado en SQLite debe leerse sin diferencias"""
+        estado = construir_estado(serie, "s")
+        con = sqlite3.connect(tmp_path / "test.db")
+        guardar_estados(con, {"s": estado})
+        leidos = cargar_estados(con)
+        con.close()
+        assert not diferencias_estado(estado, leidos["s"])
+
+
+
+
+class TestEstadoDesdeBD:
+    """Clase para definir los tests de 'actualizar_estado_forecast' sobre la BD"""
+
+    @staticmethod
+    def _cargar(con, gastos: pd.DataFrame) -> None:
+        """Simula la carga (huellas de raw_gastos) y el dbt build (vistas como tablas)"""
+        registrar_huellas({"gastos": gastos}, con)
+        fechas = pd.to_datetime(gastos["date"])
+        vista = (
+            gastos.assign(anio=fechas.dt.year, mes=fechas.dt.month)
+            .groupby(["anio", "mes"], as_index=False)["amount_usd"].sum()
+            .rename(columns={"amount_usd": "gastos_usd"})
+        )
+        vista.to_sql("vw_gastos_mensuales", con, if_exists="replace", index=False)
+        for nombre, col in (("vw_ingresos_mensuales", "ingresos_usd"), ("vw_mrr_mensual", "mrr_usd")):
+            vista.rename(columns={"gastos_usd": col}).to_sql(nombre, con, if_exists="replace", index=False)
+
+
+    def test_lee_solo_meses_nuevos_y_reconstruye_si_se_corrige(self, serie, tmp_path, monkeypatch): # pylint: disable=redefined-outer-name
+        """Un mes nuevo se lee desde el último periodo; una corrección reconstruye desde la vista completa"""
+        db = tmp_path / "test.db"
+        monkeypatch.setattr("src.analisis_financiero.DB_PATH", db)
+        monkeypatch.setattr("src.pipeline_extraccion.DB_PATH", db)
+        monkeypatch.setattr("src.analisis_financiero.PARTICIONADO", "")
+        monkeypatch.setattr("src.motor_bd.MOTOR_BD", "sqlite")
+        lecturas = []
+        original = analisis_financiero._leer_vista # pylint: disable=protected-access
+
+        def leer_vista(nombre, desde=None):
+            lecturas.append((nombre, desde))
+            return original(nombre, desde)
+
+        monkeypatch.setattr("src.analisis_financiero._leer_vista", leer_vista)
+        gastos = pd.DataFrame({"date": serie.index, "amount_usd": serie.to_numpy()})
+        con = sqlite3.connect(db)
+
+        self._cargar(con, gastos.iloc[:7])
+        actualizar_estado_forecast()
+        assert lecturas[0] == ("vw_gastos_mensuales", None)
+
+        lecturas.clear()
+        self._cargar(con, gastos)
+        estados = actualizar_estado_forecast()
+        assert lecturas[0] == ("vw_gastos_mensuales", serie.index[6])
+        assert not diferencias_estado(
+            {**construir_estado(serie, "gastos"), "huella_historia": estados["gastos"]["huella_historia"]},
+            estados["gastos"],
+        )
+
+        lecturas.clear()
+        corregidos = gastos.copy()
+        corregidos.loc[2, "amount_usd"] = 5000.0
+        self._cargar(con, corregidos)
+        estados = actualizar_estado_forecast()
+        con.close()
+        corregida = serie.copy()
+        corregida.iloc[2] = 5000.0
+        assert lecturas[0] == ("vw_gastos_mensuales", None)
+        pd.testing.assert_frame_equal(forecast_desde_estado(estados["gastos"]), forecast_lineal(corregida))
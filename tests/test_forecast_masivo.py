@@ -0,0 +1,154 @@
+"""
+Tests para forecast_masivo.py
+Cubre: ajustar_lineal_lote, forecast_lote, forecast_por_segmento, calcular_forecast_segmentos
+"""
+
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.forecast_masivo import ( # pylint: disable=wrong-import-position
+    ajustar_lineal_lote,
+    forecast_lote,
+    forecast_por_segmento,
+)
+from src.analisis_financiero import ( # pylint: disable=wrong-import-position
+    calcular_forecast_segmentos,
+    calcular_margen_proyectado,
+    forecast_lineal,
+)
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+@pytest.fixture
+def df_gastos_segmentados() -> pd.DataFrame:
+    """Vista mensual tipo 'vw_gastos_mensuales' con 2 países × 2 categorías × 6 meses"""
+    filas = []
+    for pais, base in (("COLOMBIA", 100.0), ("MEXICO", 200.0)):
+        for category, pendiente in (("MARKETING", 10.0), ("NOMINA", 5.0)):
+            for mes in range(1, 7):
+                filas.append({
+                    "anio": 2024, "mes": mes, "pais": pais, "category": category,
+                    "gastos_usd": base + pendiente * mes,
+                })
+    return pd.DataFrame(filas)
+
+
+
+
+class TestAjusteLote:
+    """Clase para definir los tests del ajuste lineal vectorizado"""
+
+    def test_coincide_con_polyfit(self):
+        """Cada fila debe coincidir con np.polyfit sobre la misma serie"""
+        rng = np.random.default_rng(0)
+        valores = rng.normal(100, 10, size=(50, 12))
+        intercepto, pendiente, _ = ajustar_lineal_lote(valores)
+        for i in range(len(valores)):
+            b, a = np.polyfit(np.arange(12), valores[i], deg=1)
+            assert pendiente[i] == pytest.approx(b)
+            assert intercepto[i] == pytest.approx(a)
+
+
+    def test_enmascara_meses_faltantes(self):
+        """Los NaN se ignoran en el ajuste y las series cortas quedan sin ajuste"""
+        valores = np.array([
+            [1.0, np.nan, 3.0, 4.0, np.nan],
+            [np.nan, np.nan, np.nan, 7.0, 8.0],
+        ])
+        intercepto, pendiente, n = ajustar_lineal_lote(valores)
+        assert pendiente[0] == pytest.approx(1.0)
+        assert intercepto[0] == pytest.approx(1.0)
+        assert n.tolist() == [3, 2]
+        assert np.isnan(pendiente[1])
+
+
+    def test_equivale_a_forecast_lineal(self):
+        """Sin meses faltantes debe reproducir 'forecast_lineal'"""
+        serie = pd.Series(
+            [100.0, 120.0, 90.0, 150.0, 160.0],
+            index=pd.date_range("2024-01-01", periods=5, freq="MS"),
+        )
+        esperado = forecast_lineal(serie, meses_adelante=3)["forecast_usd"].to_numpy()
+        assert forecast_lote(serie.to_numpy()[None, :])[0] == pytest.approx(esperado)
+
+
+
+
+class TestVariantes:
+    """Clase para definir los tests de las variantes estacional y amortiguada"""
+
+    def test_tendencia_amortiguada(self):
+        """Con phi < 1 los incrementos futuros deben decrecer geométricamente"""
+        valores = np.arange(10, dtype=float)[None, :]
+        resultado = forecast_lote(valores, meses_adelante=3, amortiguamiento=0.5)
+        assert resultado[0].tolist() == pytest.approx([9.5, 9.75, 9.88])
+
+
+    def test_amortiguamiento_invalido(self):
+        """Un phi fuera de (0, 1) debe rechazarse"""
+        with pytest.raises(ValueError):
+            forecast_lote(np.ones((1, 5)), amortiguamiento=1.5)
+
+
+    def test_estacionalidad_aditiva(self):
+        """Una serie puramente estacional debe repetir su patrón"""
+        patron = np.array([10.0, 20.0, 30.0, 40.0] * 3)
+        resultado = forecast_lote(
+            patron[None, :] + 100, meses_adelante=4, estacional=True, periodo_estacional=4
+        )
+        assert resultado[0] == pytest.approx(patron[:4] + 100)
+
+
+
+
+class TestForecastPorSegmento:
+    """Clase para definir los tests del forecast tidy por segmento"""
+
+    def test_frame_tidy(self, df_gastos_segmentados): # pylint: disable=redefined-outer-name
+        """Debe retornar una fila por serie y mes futuro"""
+        resultado = forecast_por_segmento(
+            df_gastos_segmentados, ["pais", "category"], "gastos_usd"
+        )
+        assert list(resultado.columns) == ["pais", "category", "periodo", "forecast_usd"]
+        assert len(resultado) == 4 * 3
+        fila = resultado[
+            (resultado["pais"] == "MEXICO") & (resultado["category"] == "MARKETING")
+        ].iloc[0]
+        assert fila["periodo"] == pd.Timestamp("2024-07-01")
+        assert fila["forecast_usd"] == pytest.approx(270.0)
+
+
+    def test_consumible_por_margen(self, df_gastos_segmentados): # pylint: disable=redefined-outer-name
+        """'calcular_margen_proyectado' debe agregar el forecast por país"""
+        gastos = forecast_por_segmento(
+            df_gastos_segmentados, ["pais", "category"], "gastos_usd"
+        )
+        ingresos = gastos.groupby(["pais", "periodo"], as_index=False)["forecast_usd"].sum()
+        ingresos["forecast_usd"] *= 2
+        margen = calcular_margen_proyectado(ingresos, gastos, ingresos, claves=["pais"])
+        assert len(margen) == 2 * 3
+        assert (margen["margen_pct"] == 50.0).all()
+
+
+    def test_forecast_segmentos_del_analisis(self, df_gastos_segmentados): # pylint: disable=redefined-outer-name
+        """El análisis debe producir el forecast de cada segmento y el margen por país"""
+        df_ingresos = (
+            df_gastos_segmentados.groupby(["anio", "mes", "pais"], as_index=False)["gastos_usd"].sum()
+            .rename(columns={"gastos_usd": "ingresos_usd"})
+        )
+        df_ingresos["ingresos_usd"] *= 2
+        df_mrr = df_gastos_segmentados.rename(columns={"category": "plan", "gastos_usd": "mrr_usd"})
+
+        forecast, margen = calcular_forecast_segmentos(df_gastos_segmentados, df_ingresos, df_mrr)
+
+        assert forecast.groupby("serie").size().to_dict() == {"gastos": 12, "ingresos": 6, "mrr": 12}
+        assert forecast.loc[forecast["serie"] == "ingresos", "category"].isna().all()
+        assert len(margen) == 2 * 3
+        assert (margen["margen_pct"] == 50.0).all()
@@ -1,14 +1,16 @@
 """
 Tests para main.py
-Cubre: ejecutar_transformacion y main
+Cubre: ejecutar_transformacion, ejecutar_dbt_por_particion y main
 """
 
 import sys
 import logging
 from unittest.mock import MagicMock, patch
+import pandas as pd
 import pytest
 
-from main import ejecutar_transformacion, main # pylint: disable=wrong-import-position
+from main import ejecutar_dbt_por_particion, ejecutar_transformacion, main # pylint: disable=wrong-import-position
+from src.particiones import escribir_particiones # pylint: disable=wrong-import-position
 
 
 
@@ -54,6 +56,35 @@ class TestEjecutarTransformacion:
         assert mock_run.call_count == 2
 
 
+    @patch("main.subprocess.run")
+    def test_dbt_solo_sobre_shards_modificados(self, mock_run, tmp_path, monkeypatch):
+        """Con PARTICIONADO=pais, dbt debe correr solo sobre los shards reescritos desde su última construcción"""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "dbt_env").mkdir()
+        monkeypatch.setattr("src.particiones.DIR_PARTICIONES", tmp_path / "particiones")
+        mock_run.return_value = MagicMock(returncode=0)
+        particiones = {
+            pais: {"raw_gastos": pd.DataFrame({"country": [pais], "amount_usd": [10.0]})}
+            for pais in ("COLOMBIA", "MEXICO")
+        }
+
+        def construidas():
+            return sorted(c.kwargs["env"]["DBT_SQLITE_DB"].split("/")[-1] for c in mock_run.call_args_list)
+
+        escribir_particiones(particiones, "pais")
+        assert ejecutar_dbt_por_particion()
+        assert construidas() == ["COLOMBIA.db", "MEXICO.db"]
+
+        mock_run.reset_mock()
+        assert ejecutar_dbt_por_particion()
+        assert not mock_run.called
+
+        particiones["MEXICO"]["raw_gastos"].loc[0, "amount_usd"] = 99.0
+        escribir_particiones(particiones, "pais")
+        assert ejecutar_dbt_por_particion()
+        assert construidas() == ["MEXICO.db"]
+
+
     def test_lanza_error_si_dbt_env_no_existe(self, tmp_path, monkeypatch):
         """Debe lanzar FileNotFoundError si la carpeta dbt_env no existe"""
         monkeypatch.chdir(tmp_path)
@@ -90,6 +121,16 @@ class TestMain:
         mock_af.assert_not_called()
 
 
+    @patch("main.ejecutar_extraccion")
+    @patch("main.ejecutar_modo_watch")
+    def test_watch_no_ejecuta_etapas_batch(self, mock_watch, mock_ext):
+        """--watch debe entrar al modo watch sin ejecutar el pipeline por etapas"""
+        with patch.object(sys, "argv", ["main.py", "--watch"]):
+            main()
+        mock_watch.assert_called_once()
+        mock_ext.assert_not_called()
+
+
     @patch("main.ejecutar_transformacion", side_effect=RuntimeError("fallo inesperado"))
     def test_excepcion_llama_sys_exit_1(self, _):
         """Cualquier excepción dentro de 'main' debe resultar en sys.exit(1)"""
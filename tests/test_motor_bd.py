@@ -0,0 +1,74 @@
+"""
+Tests para motor_bd.py
+Cubre: obtener_motor, MotorSQLite, MotorDuckDB, vistas de reporting en ambos motores
+"""
+
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.motor_bd import obtener_motor # pylint: disable=wrong-import-position
+from benchmarks.benchmark_motores import generar_datos, sql_vista # pylint: disable=wrong-import-position
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+
+
+
+class TestMotores:
+    """Clase para definir los tests de los motores de BD"""
+
+    @pytest.mark.parametrize("nombre", ["sqlite", "duckdb"])
+    def test_escribe_y_lee(self, nombre, tmp_path):
+        """Cada motor debe crear, reemplazar y leer tablas con la misma interfaz"""
+        if nombre == "duckdb":
+            pytest.importorskip("duckdb")
+        motor = obtener_motor(nombre)
+        con = motor.conectar(tmp_path / "test.db")
+        try:
+            assert not motor.existe_tabla(con, "raw_gastos")
+            motor.escribir_tabla(con, "raw_gastos", pd.DataFrame({"amount_usd": [1.0, 2.0]}))
+            motor.escribir_tabla(con, "raw_gastos", pd.DataFrame({"amount_usd": [5.0]}))
+            df = motor.leer(con, "SELECT SUM(amount_usd) AS total FROM raw_gastos WHERE amount_usd > ?", (1.0,))
+            assert motor.existe_tabla(con, "raw_gastos")
+            assert df["total"].iloc[0] == 5.0
+        finally:
+            con.close()
+        assert motor.ruta(tmp_path / "test.db").exists()
+
+
+    def test_motor_no_soportado(self):
+        """Un motor desconocido debe lanzar ValueError"""
+        with pytest.raises(ValueError, match="no soportado"):
+            obtener_motor("postgres")
+
+
+
+
+class TestVistasReporting:
+    """Clase para definir los tests de las vistas de reporting sobre cada motor"""
+
+    @pytest.mark.parametrize("nombre", ["sqlite", "duckdb"])
+    def test_nuevos_clientes_una_fila_por_trimestre(self, nombre, tmp_path):
+        """vw_nuevos_clientes_trimestrales debe tener una fila por año, trimestre, país y canal"""
+        if nombre == "duckdb":
+            pytest.importorskip("duckdb")
+        datos = generar_datos(500)
+        motor = obtener_motor(nombre)
+        con = motor.conectar(tmp_path / "test.db")
+        try:
+            for tabla in ["dim_fecha", "dim_clientes"]:
+                motor.escribir_tabla(con, tabla, datos[tabla])
+            con.execute(
+                f"CREATE VIEW vw_nuevos_clientes_trimestrales AS {sql_vista('vw_nuevos_clientes_trimestrales')}"
+            )
+            df = motor.leer(con, "SELECT * FROM vw_nuevos_clientes_trimestrales")
+        finally:
+            con.close()
+        assert not df.duplicated(["anio", "trimestre", "pais", "acquisition_channel"]).any()
+        assert df["nuevos_clientes"].sum() == len(datos["dim_clientes"])
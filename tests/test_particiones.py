@@ -0,0 +1,152 @@
+"""
+Tests para particiones.py
+Cubre: escribir_particiones, listar_particiones, particiones_pendientes, abrir_particiones,
+       leer_particionado
+"""
+
+import sys
+import sqlite3
+from pathlib import Path
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.particiones import ( # pylint: disable=wrong-import-position
+    abrir_particiones,
+    escribir_particiones,
+    leer_particionado,
+    listar_particiones,
+    particiones_pendientes,
+    registrar_construccion,
+    VALOR_SIN_PARTICION,
+)
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+@pytest.fixture
+def particiones(tmp_path, monkeypatch) -> dict[str, dict[str, pd.DataFrame]]:
+    """Dos shards por país con una tabla raw y una vista de reporting materializada"""
+    monkeypatch.setattr("src.particiones.DIR_PARTICIONES", tmp_path / "particiones")
+    return {
+        pais: {
+            "raw_gastos": pd.DataFrame({"country": [pais] * 2, "amount_usd": [monto, monto]}),
+            "vw_gastos_mensuales": pd.DataFrame({
+                "anio": [2024], "mes": [1], "pais": [pais], "category": ["MARKETING"],
+                "gastos_usd": [monto * 2],
+            }),
+        }
+        for pais, monto in (("COLOMBIA", 10.0), ("MEXICO", 20.0))
+    }
+
+
+
+
+class TestEscribirParticiones:
+    """Clase para definir los tests de escritura y catálogo de particiones"""
+
+    def test_registra_catalogo(self, particiones): # pylint: disable=redefined-outer-name
+        """Cada shard debe escribirse y quedar registrado con sus tablas y filas"""
+        reescritas = escribir_particiones(particiones, "pais", max_procesos=2)
+        catalogo = listar_particiones("pais")
+        assert sorted(reescritas) == ["COLOMBIA", "MEXICO"]
+        assert set(catalogo["tabla"]) == {"raw_gastos", "vw_gastos_mensuales"}
+        assert all(Path(ruta).exists() for ruta in catalogo["ruta"])
+
+
+    def test_solo_reescribe_shards_modificados(self, particiones): # pylint: disable=redefined-outer-name
+        """Una corrección de un país debe reescribir solo su shard"""
+        escribir_particiones(particiones, "pais")
+        particiones["MEXICO"]["raw_gastos"].loc[0, "amount_usd"] = 99.0
+        assert escribir_particiones(particiones, "pais") == ["MEXICO"]
+
+
+    def test_solo_construye_shards_modificados(self, particiones): # pylint: disable=redefined-outer-name
+        """Tras construir, solo el shard reescrito o un cambio de versión del proyecto quedan pendientes"""
+        escribir_particiones(particiones, "pais")
+        assert sorted(particiones_pendientes("pais", "v1")["valor"]) == ["COLOMBIA", "MEXICO"]
+
+        registrar_construccion("pais", ["COLOMBIA", "MEXICO"], "v1")
+        assert particiones_pendientes("pais", "v1").empty
+
+        particiones["MEXICO"]["raw_gastos"].loc[0, "amount_usd"] = 99.0
+        escribir_particiones(particiones, "pais")
+        assert particiones_pendientes("pais", "v1")["valor"].tolist() == ["MEXICO"]
+        assert sorted(particiones_pendientes("pais", "v2")["valor"]) == ["COLOMBIA", "MEXICO"]
+
+
+    def test_clave_invalida(self, particiones): # pylint: disable=redefined-outer-name
+        """Una clave de partición desconocida debe rechazarse"""
+        with pytest.raises(ValueError, match="no soportada"):
+            escribir_particiones(particiones, "region")
+
+
+
+
+class TestConsultaParticionada:
+    """Clase para definir los tests de la fachada de consulta"""
+
+    def test_poda_de_particiones(self, particiones): # pylint: disable=redefined-outer-name
+        """Solo deben leerse los shards de los valores pedidos"""
+        escribir_particiones(particiones, "pais")
+        todos = leer_particionado("vw_gastos_mensuales")
+        mexico = leer_particionado("vw_gastos_mensuales", ["MEXICO"])
+        assert sorted(todos["pais"]) == ["COLOMBIA", "MEXICO"]
+        assert mexico["pais"].tolist() == ["MEXICO"]
+
+
+    def test_valor_desconocido(self, particiones): # pylint: disable=redefined-outer-name
+        """Un valor sin shard (p. ej. un país mal escrito) debe fallar nombrando el valor"""
+        with pytest.raises(ValueError, match="No hay particiones"):
+            leer_particionado("vw_gastos_mensuales")
+        escribir_particiones(particiones, "pais")
+        with pytest.raises(ValueError, match="MEXCO.*disponibles: COLOMBIA, MEXICO"):
+            leer_particionado("vw_gastos_mensuales", ["MEXCO", "COLOMBIA"])
+
+
+    def test_vista_no_particionable(self, particiones): # pylint: disable=redefined-outer-name
+        """Vistas que no agrupan por país no pueden unirse desde shards"""
+        escribir_particiones(particiones, "pais")
+        with pytest.raises(ValueError, match="vw_fcf_mensual"):
+            leer_particionado("vw_fcf_mensual")
+
+
+    def test_consulta_sql_sobre_shards(self, particiones): # pylint: disable=redefined-outer-name
+        """La conexión debe exponer la unión de los shards pedidos como tabla consultable"""
+        escribir_particiones(particiones, "pais")
+        with abrir_particiones(["raw_gastos"], ["COLOMBIA", "MEXICO"]) as con:
+            total = con.execute("SELECT SUM(amount_usd) FROM raw_gastos").fetchone()[0]
+        assert total == 60.0
+
+
+    def test_vistas_construidas_por_dbt(self, particiones): # pylint: disable=redefined-outer-name
+        """Las vistas con referencias "main"."tabla" (como las escribe dbt) deben poder leerse"""
+        for pais, tablas in particiones.items():
+            del tablas["vw_gastos_mensuales"]
+            tablas["fact_gastos"] = pd.DataFrame({"country": [pais], "amount_usd": [5.0]})
+        escribir_particiones(particiones, "pais")
+        for ruta in listar_particiones("pais")["ruta"].unique():
+            with sqlite3.connect(ruta) as con:
+                con.execute(
+                    'CREATE VIEW vw_gastos_mensuales AS SELECT country AS pais, '
+                    'SUM(amount_usd) AS gastos_usd FROM "main"."fact_gastos" GROUP BY country'
+                )
+            con.close()
+
+        df = leer_particionado("vw_gastos_mensuales")
+        with abrir_particiones(["vw_gastos_mensuales"]) as con:
+            total = con.execute("SELECT SUM(gastos_usd) FROM vw_gastos_mensuales").fetchone()[0]
+        assert sorted(df["pais"]) == ["COLOMBIA", "MEXICO"]
+        assert total == 10.0
+
+
+    def test_excluye_sin_valor_por_defecto(self, particiones): # pylint: disable=redefined-outer-name
+        """El shard SIN_VALOR solo se lee si se pide explícitamente"""
+        particiones[VALOR_SIN_PARTICION] = {
+            "raw_gastos": pd.DataFrame({"country": [None], "amount_usd": [1.0]}),
+        }
+        escribir_particiones(particiones, "pais")
+        assert len(leer_particionado("raw_gastos")) == 4
+        assert len(leer_particionado("raw_gastos", [VALOR_SIN_PARTICION])) == 1
@@ -1,17 +1,28 @@
 """
 Tests para pipeline_extraccion.py
-Cubre: extraer_datos, validar_datos, cargar_datos
+Cubre: extraer_datos, validar_datos, normalizar_monedas, cargar_datos (con huellas de carga),
+       dividir_en_particiones
 """
 
 import sys
 from pathlib import Path
 import logging
 import sqlite3
+import numpy as np
 import pandas as pd
 import pytest
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
-from src.pipeline_extraccion import extraer_datos, validar_datos, cargar_datos # pylint: disable=wrong-import-position
+from src.pipeline_extraccion import ( # pylint: disable=wrong-import-position
+    extraer_datos,
+    extraer_tasas_cambio,
+    validar_datos,
+    normalizar_monedas,
+    tasas_asof,
+    cargar_datos,
+    dividir_en_particiones,
+    leer_huellas_carga,
+)
 
 
 
@@ -51,6 +62,15 @@ def datos_validos() -> dict[str, pd.DataFrame]:
         }),
     }
 
+@pytest.fixture
+def tasas() -> pd.DataFrame:
+    """Tasas diarias (USD por unidad local) con un hueco de fin de semana"""
+    return pd.DataFrame({
+        "date": pd.to_datetime(["2024-01-05", "2024-01-08", "2024-01-05"]),
+        "currency": ["MXN", "MXN", "COP"],
+        "usd_rate": [0.05, 0.06, 0.00025],
+    })
+
 
 
 
@@ -154,6 +174,65 @@ class TestValidarDatos:
         assert len(resultado["transacciones"]) == 2
 
 
+    def test_negativos_en_feed_mixto_conservan_la_otra_moneda(self, datos_validos): # pylint: disable=redefined-outer-name
+        """Un negativo en una moneda no debe eliminar las filas con monto nulo de la otra"""
+        datos_validos["gastos"] = pd.DataFrame({
+            "date": ["2024-01-01"] * 4,
+            "currency": ["USD", "USD", "MXN", "MXN"],
+            "amount_usd": [30.0, -1.0, np.nan, np.nan],
+            "amount_local": [np.nan, np.nan, 500.0, -20.0],
+        })
+        resultado = validar_datos(datos_validos)["gastos"]
+        assert resultado["currency"].tolist() == ["USD", "MXN"]
+        assert resultado["amount_usd"].iloc[0] == 30.0
+        assert resultado["amount_local"].iloc[1] == 500.0
+
+
+
+
+class TestNormalizarMonedas:
+    """Clase para definir todos los tests de la normalización FX"""
+
+    def test_tasa_asof(self, tasas): # pylint: disable=redefined-outer-name
+        """Debe usar la última tasa de la moneda con fecha igual o anterior"""
+        fechas = pd.Series(pd.to_datetime(
+            ["2024-01-05", "2024-01-07", "2024-01-09", "2024-01-04", "2024-01-06", "2024-01-06"]
+        ))
+        monedas = pd.Series(["MXN", "MXN", "MXN", "MXN", "COP", None])
+        resultado = tasas_asof(fechas, monedas, tasas)
+        np.testing.assert_allclose(
+            resultado, [0.05, 0.05, 0.06, np.nan, 0.00025, 1.0]
+        )
+
+
+    def test_conserva_original_y_usd(self, datos_validos, tasas): # pylint: disable=redefined-outer-name
+        """Debe calcular el monto USD y conservar moneda, monto local y tasa aplicada"""
+        datos_validos["gastos"] = pd.DataFrame({
+            "date": pd.to_datetime(["2024-01-06", "2024-01-06"]),
+            "currency": ["MXN", "USD"],
+            "amount_local": [1000.0, np.nan],
+            "amount_usd": [np.nan, 30.0],
+        })
+        resultado = normalizar_monedas(datos_validos, tasas)["gastos"]
+        assert resultado["amount_usd"].tolist() == [50.0, 30.0]
+        assert resultado["amount_local"].iloc[0] == 1000.0
+        assert resultado["fx_rate_usd"].tolist() == [0.05, 1.0]
+        assert "fx_rate_usd" not in datos_validos["pagos"].columns
+
+
+    def test_error_si_faltan_tasas(self, datos_validos): # pylint: disable=redefined-outer-name
+        """Datos en moneda local sin archivo de tasas deben lanzar FileNotFoundError"""
+        datos_validos["pagos"]["currency"] = "MXN"
+        with pytest.raises(FileNotFoundError, match="fx_rates.csv"):
+            normalizar_monedas(datos_validos, None)
+
+
+    def test_archivo_de_tasas_opcional(self, tmp_path, monkeypatch):
+        """Sin archivo de tasas debe retornar None"""
+        monkeypatch.setattr("src.pipeline_extraccion.RAW_DIR", tmp_path)
+        assert extraer_tasas_cambio() is None
+
+
 
 
 class TestCargarDatos:
@@ -178,10 +257,49 @@ class TestCargarDatos:
         esperadas = {
             "raw_transacciones", "raw_pagos", "raw_gastos",
             "raw_clientes", "raw_empleados", "raw_suscripciones",
+            "huellas_carga",
         }
         assert esperadas == tablas
 
 
+    def test_carga_en_duckdb(self, datos_validos, tmp_path, monkeypatch): # pylint: disable=redefined-outer-name
+        """Con MOTOR_BD=duckdb las tablas raw_* deben quedar en el archivo .duckdb"""
+        duckdb = pytest.importorskip("duckdb")
+        monkeypatch.setattr("src.pipeline_extraccion.DB_PATH", tmp_path / "test.db")
+        monkeypatch.setattr("src.motor_bd.MOTOR_BD", "duckdb")
+
+        cargar_datos(datos_validos)
+
+        con = duckdb.connect(str(tmp_path / "test.duckdb"))
+        tablas = {fila[0] for fila in con.execute("SHOW TABLES").fetchall()}
+        con.close()
+        assert "raw_transacciones" in tablas
+        assert len(tablas) == 7
+
+
+    def test_huellas_por_mes(self, datos_validos, tmp_path, monkeypatch): # pylint: disable=redefined-outer-name
+        """Solo el mes corregido debe cambiar de huella; una carga parcial conserva las demás tablas"""
+        monkeypatch.setattr("src.pipeline_extraccion.DB_PATH", tmp_path / "test.db")
+        datos_validos["gastos"] = pd.DataFrame({
+            "date": pd.to_datetime(["2024-01-05", "2024-01-20", "2024-02-03"]),
+            "amount_usd": [30.0, 40.0, 50.0],
+        })
+        cargar_datos(datos_validos)
+        con = sqlite3.connect(tmp_path / "test.db")
+        antes = leer_huellas_carga(con).set_index(["tabla", "periodo"])
+
+        corregidos = datos_validos["gastos"].copy()
+        corregidos.loc[1, "amount_usd"] = 45.0
+        cargar_datos({"gastos": corregidos}, con=con)
+        despues = leer_huellas_carga(con).set_index(["tabla", "periodo"])
+        con.close()
+
+        assert antes.loc[("raw_gastos", "2024-01"), "filas"] == 2
+        assert antes.loc[("raw_gastos", "2024-01"), "huella"] != despues.loc[("raw_gastos", "2024-01"), "huella"]
+        assert antes.loc[("raw_gastos", "2024-02"), "huella"] == despues.loc[("raw_gastos", "2024-02"), "huella"]
+        assert ("raw_pagos", "2024-01") in despues.index
+
+
     def test_propaga_error_sqlite(self, datos_validos, monkeypatch): # pylint: disable=redefined-outer-name
         """Un error de SQLite debe propagarse"""
         monkeypatch.setattr(
@@ -189,3 +307,48 @@ class TestCargarDatos:
         )
         with pytest.raises(Exception):
             cargar_datos(datos_validos)
+
+
+
+
+
+class TestDividirEnParticiones:
+    """Clase para definir todos los tests de la función 'dividir_en_particiones'"""
+
+    def test_por_pais_hereda_pais_relacionado(self):
+        """Pagos toman el país de su transacción y las tablas sin país se replican"""
+        datos = {
+            "transacciones": pd.DataFrame({
+                "transaction_id": [1, 2], "country": ["mexico ", "COLOMBIA"], "total_usd": [1.0, 2.0],
+            }),
+            "pagos": pd.DataFrame({"payment_id": [10, 11], "transaction_id": [2, 1]}),
+            "tasas_cambio": pd.DataFrame({"currency": ["MXN"], "usd_rate": [0.05]}),
+        }
+        particiones = dividir_en_particiones(datos, "pais")
+        assert sorted(particiones) == ["COLOMBIA", "MEXICO"]
+        assert particiones["MEXICO"]["raw_pagos"]["payment_id"].tolist() == [11]
+        assert len(particiones["COLOMBIA"]["raw_tasas_cambio"]) == 1
+
+
+    def test_todos_los_shards_tienen_todas_las_tablas(self):
+        """Un shard sin filas de una tabla debe recibirla vacía (con sus columnas)"""
+        datos = {
+            "transacciones": pd.DataFrame({
+                "transaction_id": [1], "country": ["PERU"], "total_usd": [1.0],
+            }),
+            "pagos": pd.DataFrame({"payment_id": [10], "transaction_id": [99]}),
+            "gastos": pd.DataFrame({"country": ["CHILE"], "amount_usd": [5.0]}),
+        }
+        particiones = dividir_en_particiones(datos, "pais")
+        assert sorted(particiones) == ["CHILE", "PERU", "SIN_VALOR"]
+        for tablas in particiones.values():
+            assert set(tablas) == {"raw_transacciones", "raw_pagos", "raw_gastos"}
+        assert particiones["PERU"]["raw_gastos"].empty
+        assert list(particiones["PERU"]["raw_gastos"].columns) == ["country", "amount_usd"]
+        assert len(particiones["SIN_VALOR"]["raw_pagos"]) == 1
+
+
+    def test_clave_no_soportada(self, datos_validos): # pylint: disable=redefined-outer-name
+        """Solo se admite el particionado por país"""
+        with pytest.raises(ValueError, match="no soportada"):
+            dividir_en_particiones(datos_validos, "mes")
@@ -0,0 +1,117 @@
+"""
+Tests para reporte.py
+Cubre: top_n_con_otros, seccion_categorias, seccion_anomalias, renderizar, guardar_formatos
+"""
+
+import sys
+import json
+from io import StringIO
+from pathlib import Path
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.reporte import ( # pylint: disable=wrong-import-position
+    top_n_con_otros,
+    seccion_categorias,
+    seccion_anomalias,
+    seccion_forecast,
+    renderizar,
+    guardar_formatos,
+)
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+@pytest.fixture
+def resumen_cat() -> pd.DataFrame:
+    """Resumen por categoría ya ordenado de mayor a menor"""
+    return pd.DataFrame({
+        "category": ["NOMINA", "CLOUD", "LEGAL|FISCAL", "VIAJES"],
+        "total": [12345.678, 2000.0, 100.1, 50.2],
+        "transacciones": [10, 4, 2, 1],
+        "pct": [85.07, 13.78, 0.69, 0.35],
+    })
+
+@pytest.fixture
+def margen() -> pd.DataFrame:
+    """Margen proyectado de dos meses"""
+    return pd.DataFrame({
+        "periodo": pd.date_range("2025-01-01", periods=2, freq="MS"),
+        "ingresos_forecast": [1000.0, 1100.0],
+        "gastos_forecast": [900.0, 1200.0],
+        "mrr_forecast": [50.0, 60.0],
+        "margen_usd": [100.0, -100.0],
+        "margen_pct": [10.0, -9.1],
+    })
+
+
+
+
+class TestSecciones:
+    """Clase para definir los tests del formateo vectorizado de las secciones"""
+
+    def test_otros_conserva_tipos(self, resumen_cat): # pylint: disable=redefined-outer-name
+        """La fila 'OTROS' debe sumar la cola larga sin convertir los conteos a float"""
+        df = top_n_con_otros(resumen_cat, "category", ["total", "transacciones"], 2)
+        assert df["category"].tolist()[-1] == "OTROS (2)"
+        assert df["transacciones"].tolist() == [10, 4, 3]
+        assert df["total"].iloc[-1] == 150.3
+
+
+    def test_lineas_de_texto(self, resumen_cat): # pylint: disable=redefined-outer-name
+        """Cada fila debe formatearse con el mismo layout de ancho fijo del reporte"""
+        seccion = seccion_categorias(resumen_cat, 2)
+        assert seccion["lineas"][:2] == ["", "── CLASIFICACIÓN DE GASTOS POR CATEGORÍA ──"]
+        assert seccion["lineas"][2] == (
+            f"  • {'NOMINA':<22} USD {12345.678:>12,.2f}  (85.07%)  [10 transacciones]"
+        )
+
+
+    def test_anomalias_sin_categoria(self):
+        """Las anomalías de transacciones (sin categoría) muestran solo el país"""
+        anomalias = pd.DataFrame({
+            "origen": ["transacciones"], "registro_key": ["T1"], "date_key": [20240105],
+            "country": ["PERU"], "category": [None], "monto_usd": [5000.0],
+            "mediana_usd": [100.0], "mad_usd": [10.0], "z_robusta": [330.75],
+        })
+        linea = seccion_anomalias(anomalias, 5)["lineas"][2]
+        assert linea.startswith(f"  • {'transacciones':<13} 2024-01-05  {'PERU':<30} USD")
+        assert linea.endswith("(mediana USD 100.00, z=+330.8)")
+
+
+
+
+class TestRenderizar:
+    """Clase para definir los tests de la salida multi-formato"""
+
+    def test_formatos_con_el_mismo_contenido(self, resumen_cat, margen): # pylint: disable=redefined-outer-name
+        """Markdown, JSON y CSV deben contener las mismas filas y valores"""
+        secciones = [seccion_categorias(resumen_cat, 10), seccion_forecast(margen)]
+        salidas = renderizar({"fecha": "2025-01-01 00:00"}, secciones, "Conclusión")
+
+        documento = json.loads(salidas["json"])
+        assert documento["conclusiones_ia"] == "Conclusión"
+        assert documento["secciones"]["forecast"]["filas"][0]["periodo"] == "2025-01-01"
+        assert len(documento["secciones"]["categorias"]["filas"]) == 4
+
+        csv = pd.read_csv(StringIO(salidas["csv"]))
+        assert len(csv) == 4 * 3 + 2 * 5
+        fila = csv[(csv["seccion"] == "categorias") & (csv["metrica"] == "total")].iloc[0]
+        assert (fila["segmento"], float(fila["valor"])) == ("NOMINA", 12345.678)
+
+        assert "| NOMINA | 12,345.68 | 85.07% | 10 |" in salidas["md"]
+        assert r"| LEGAL\|FISCAL |" in salidas["md"]
+        assert "| 2025-02 | 1,100.00 | 60.00 | 1,200.00 | -100.00 | -9.1% |" in salidas["md"]
+
+
+    def test_guarda_junto_al_reporte(self, tmp_path, resumen_cat): # pylint: disable=redefined-outer-name
+        """Cada formato se escribe con el nombre del reporte de texto y su extensión"""
+        salidas = renderizar({}, [seccion_categorias(resumen_cat, 10)])
+        rutas = guardar_formatos(salidas, tmp_path / "analisis_financiero_ia.txt")
+        assert sorted(r.name for r in rutas) == [
+            "analisis_financiero_ia.csv", "analisis_financiero_ia.json", "analisis_financiero_ia.md",
+        ]
+        assert all(r.read_text(encoding="utf-8") for r in rutas)
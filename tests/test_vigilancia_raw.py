@@ -0,0 +1,226 @@
+"""
+Tests para vigilancia_raw.py
+Cubre: tablas_cambiadas, expandir_dependencias, selectores_dbt, VigilanteRaw
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import subprocess
+from pathlib import Path
+from unittest.mock import MagicMock
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+from src.vigilancia_raw import ( # pylint: disable=wrong-import-position
+    tablas_cambiadas,
+    expandir_dependencias,
+    selectores_dbt,
+    espera_reintento,
+    VigilanteRaw,
+)
+
+
+
+
+pytestmark = pytest.mark.filterwarnings("ignore")
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    """Directorio raw, BD y archivo de métricas temporales"""
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    monkeypatch.setattr("src.pipeline_extraccion.RAW_DIR", raw)
+    monkeypatch.setattr("src.pipeline_extraccion.DB_PATH", tmp_path / "test.db")
+    monkeypatch.setattr("src.pipeline_extraccion.PARTICIONADO", "")
+    monkeypatch.setattr("src.motor_bd.MOTOR_BD", "sqlite")
+    monkeypatch.setattr("src.vigilancia_raw.ARCHIVO_METRICAS", tmp_path / "metricas.jsonl")
+    (raw / "expenses.csv").write_text("date,amount_usd\n2024-01-01,30.0\n")
+    return tmp_path
+
+
+def _modificar(ruta: Path, contenido: str) -> None:
+    """Reescribe un archivo asegurando un mtime distinto"""
+    ruta.write_text(contenido)
+    info = ruta.stat()
+    os.utime(ruta, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+
+
+
+
+class TestDeteccionCambios:
+    """Clase para definir los tests de la detección de tablas a procesar"""
+
+    def test_detecta_nuevas_y_modificadas(self):
+        """Solo deben reportarse las tablas con huella nueva o distinta"""
+        previas = {"gastos": (1, 10), "pagos": (1, 10), "clientes": (1, 10)}
+        actuales = {"gastos": (1, 10), "pagos": (2, 12), "empleados": (1, 5)}
+        assert tablas_cambiadas(previas, actuales) == {"pagos", "empleados"}
+
+
+    def test_tasas_arrastran_tablas_en_moneda_local(self):
+        """Un cambio de tasas debe reprocesar las tablas con conversión FX"""
+        assert expandir_dependencias({"tasas_cambio"}) == {
+            "tasas_cambio", "transacciones", "pagos", "gastos", "suscripciones",
+        }
+        assert expandir_dependencias({"clientes"}) == {"clientes"}
+
+
+    def test_selectores_solo_para_fuentes_dbt(self):
+        """Cada tabla fuente selecciona sus modelos dependientes; las tasas no son fuente dbt"""
+        assert selectores_dbt({"gastos", "tasas_cambio"}) == ["source:raw.raw_gastos+"]
+
+
+
+
+class TestVigilanteRaw:
+    """Clase para definir los tests del bucle de micro-lotes"""
+
+    def test_procesa_solo_lo_cambiado(self, entorno): # pylint: disable=redefined-outer-name
+        """Un archivo nuevo debe cargarse y construirse sin tocar las tablas previas"""
+        ejecutor = MagicMock()
+        ejecutor.build.return_value = True
+        vigilante = VigilanteRaw(ejecutor_dbt=ejecutor)
+        vigilante.iniciar()
+        (entorno / "raw" / "payments.csv").write_text("payment_date,amount_usd\n2024-01-01,50.0\n")
+
+        vigilante.ejecutar(intervalo_s=0, debounce_s=0, max_lotes=1, esperar=lambda _: None)
+
+        ejecutor.preparar.assert_called_once()
+        ejecutor.build.assert_called_once_with(["source:raw.raw_pagos+"])
+        with sqlite3.connect(entorno / "test.db") as con:
+            tablas = {f[0] for f in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        assert tablas == {"raw_pagos", "huellas_carga"}
+
+        metricas = json.loads((entorno / "metricas.jsonl").read_text().splitlines()[-1])
+        assert metricas["ok"] and metricas["tablas"] == ["pagos"]
+        assert metricas["latencia_total_s"] >= metricas["procesamiento_s"] >= 0
+
+
+    def test_debounce_espera_archivos_estables(self, entorno): # pylint: disable=redefined-outer-name
+        """Mientras el archivo siga cambiando no debe procesarse el lote"""
+        ejecutor = MagicMock()
+        ejecutor.build.return_value = True
+        vigilante = VigilanteRaw(ejecutor_dbt=ejecutor)
+        vigilante.iniciar()
+        gastos = entorno / "raw" / "expenses.csv"
+        esperas = []
+
+        def esperar(_):
+            esperas.append(1)
+            if len(esperas) < 3:
+                _modificar(gastos, "date,amount_usd\n" + "2024-01-01,30.0\n" * (len(esperas) + 1))
+
+        vigilante.ejecutar(intervalo_s=0, debounce_s=0.05, max_lotes=1, esperar=esperar)
+
+        assert len(esperas) >= 3
+        ejecutor.build.assert_called_once_with(["source:raw.raw_gastos+"])
+
+
+    def test_error_en_lote_no_detiene_vigilancia(self, entorno): # pylint: disable=redefined-outer-name
+        """Un CSV inválido debe registrarse como lote fallido sin lanzar excepción"""
+        ejecutor = MagicMock()
+        vigilante = VigilanteRaw(ejecutor_dbt=ejecutor)
+        vigilante.iniciar()
+        (entorno / "raw" / "payments.csv").write_text("")
+
+        metricas = vigilante.procesar_lote({"pagos"})
+        vigilante.cerrar()
+
+        assert not metricas["ok"]
+        assert "error" in metricas
+        ejecutor.build.assert_not_called()
+
+
+    def test_lote_fallido_se_reintenta(self, entorno): # pylint: disable=redefined-outer-name
+        """Si el lote falla, sus archivos no deben marcarse como procesados"""
+        ejecutor = MagicMock()
+        ejecutor.build.side_effect = [False, True]
+        vigilante = VigilanteRaw(ejecutor_dbt=ejecutor)
+        vigilante.iniciar()
+        (entorno / "raw" / "payments.csv").write_text("payment_date,amount_usd\n2024-01-01,50.0\n")
+        esperas = []
+
+        def esperar(_):
+            esperas.append(1)
+            if len(esperas) > 20:
+                raise KeyboardInterrupt
+
+        vigilante.ejecutar(intervalo_s=0, debounce_s=0, max_lotes=2, esperar=esperar)
+
+        assert ejecutor.build.call_count == 2
+        assert ejecutor.build.call_args_list[1].args == (["source:raw.raw_pagos+"],)
+        assert "pagos" in vigilante.huellas
+        metricas = [json.loads(l) for l in (entorno / "metricas.jsonl").read_text().splitlines()]
+        assert [m["ok"] for m in metricas] == [False, True]
+
+
+    def test_espera_exponencial_entre_reintentos(self, monkeypatch):
+        """La espera se duplica en cada fallo y se acota en BACKOFF_MAX_S"""
+        monkeypatch.setattr("src.vigilancia_raw.BACKOFF_MAX_S", 30)
+        assert [espera_reintento(n, 5) for n in range(1, 6)] == [5, 10, 20, 30, 30]
+
+
+    def test_lote_abandonado_hasta_nuevo_cambio(self, entorno, monkeypatch, caplog): # pylint: disable=redefined-outer-name
+        """Tras MAX_REINTENTOS fallos el lote se abandona; un nuevo cambio reinicia el contador"""
+        monkeypatch.setattr("src.vigilancia_raw.MAX_REINTENTOS", 3)
+        ejecutor = MagicMock()
+        ejecutor.build.return_value = False
+        vigilante = VigilanteRaw(ejecutor_dbt=ejecutor)
+        vigilante.iniciar()
+        pagos = entorno / "raw" / "payments.csv"
+        pagos.write_text("payment_date,amount_usd\n2024-01-01,50.0\n")
+        esperas = []
+
+        def esperar(_):
+            esperas.append(ejecutor.build.call_count)
+            if len(esperas) == 1:
+                _modificar(pagos, "payment_date,amount_usd\n2024-01-01,60.0\n")
+            if len(esperas) > 20:
+                raise KeyboardInterrupt
+
+        with caplog.at_level("ERROR", logger="vigilancia_raw"):
+            vigilante.ejecutar(intervalo_s=0, debounce_s=0, max_lotes=4, esperar=esperar)
+
+        # 3 intentos del primer contenido, abandono y 1 intento tras el cambio
+        assert esperas[0] == 3
+        assert ejecutor.build.call_count == 4
+        assert "abandonado tras 3 intentos" in caplog.text
+
+
+    def test_libera_duckdb_durante_dbt(self, entorno, monkeypatch): # pylint: disable=redefined-outer-name
+        """Con DuckDB otro proceso (el CLI de dbt) debe poder abrir la BD durante el build"""
+        pytest.importorskip("duckdb")
+        monkeypatch.setattr("src.motor_bd.MOTOR_BD", "duckdb")
+        ruta = entorno / "test.duckdb"
+        abre_otro_proceso = []
+
+        def build(_):
+            resultado = subprocess.run(
+                [sys.executable, "-c", f"import duckdb; duckdb.connect({str(ruta)!r}).close()"],
+                capture_output=True, check=False,
+            )
+            abre_otro_proceso.append(resultado.returncode == 0)
+            return True
+
+        ejecutor = MagicMock()
+        ejecutor.build.side_effect = build
+        vigilante = VigilanteRaw(ejecutor_dbt=ejecutor)
+        vigilante.iniciar()
+        (entorno / "raw" / "payments.csv").write_text("payment_date,amount_usd\n2024-01-01,50.0\n")
+
+        metricas = vigilante.procesar_lote({"pagos"})
+        filas = vigilante.motor.leer(vigilante.con, "SELECT COUNT(*) AS n FROM raw_pagos")["n"].iloc[0]
+        vigilante.cerrar()
+
+        assert metricas["ok"]
+        assert abre_otro_proceso == [True]
+        assert filas == 1
+
+
+    def test_no_disponible_con_particiones(self, entorno, monkeypatch): # pylint: disable=redefined-outer-name,unused-argument
+        """El modo watch debe rechazar el almacenamiento particionado"""
+        monkeypatch.setattr("src.pipeline_extraccion.PARTICIONADO", "pais")
+        with pytest.raises(ValueError, match="PARTICIONADO"):
+            VigilanteRaw(ejecutor_dbt=MagicMock())